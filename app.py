@@ -4,6 +4,7 @@ from google.oauth2.service_account import Credentials
 import json
 import base64
 import re
+import time
 from datetime import datetime
 
 st.set_page_config(page_title="Web更新チェッカー", layout="centered", initial_sidebar_state="collapsed")
@@ -94,8 +95,17 @@ div[data-testid="stExpander"] {
 # ============================================================
 # Google Sheets 認証
 # ============================================================
-@st.cache_resource(ttl=300)
-def get_client():
+# 認証済みクライアントとシートは cache_resource で保持し続ける（トークンは自動更新される）。
+# 行データだけを cache_data(TTL付き) に分け、追加・削除ではセッション内の行を直接書き換えるので、
+# 1回の操作あたりの Sheets API 呼び出しは高々1回になる。
+SHEET_KEY = "1wSfyGreLH_lb7vR_vpmuJ3rAndtMNvMDQbv2ZlPVxUE"
+ROWS_TTL = 60
+DEFAULT_HEADERS = ["word", "url", "memo", "count", "prev_hash", "prev_len"]
+
+
+@st.cache_resource
+def _authorize():
+    """認証して gspread クライアントを返す（失敗時は例外。失敗はキャッシュされない）"""
     scopes = [
         "https://www.googleapis.com/auth/spreadsheets",
         "https://www.googleapis.com/auth/drive",
@@ -103,51 +113,107 @@ def get_client():
 
     # --- 方法1: [gcp] セクション（TOML直書き） ---
     if "gcp" in st.secrets and "private_key" in st.secrets["gcp"]:
-        try:
-            creds_dict = dict(st.secrets["gcp"])
-            creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-            return gspread.authorize(creds)
-        except Exception as e:
-            st.error(f"認証エラー(gcp): {e}")
-            return None
+        creds_dict = dict(st.secrets["gcp"])
+        creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
+        return gspread.authorize(creds)
 
     # --- 方法2: ENCODED_JSON (Base64) ---
     if "ENCODED_JSON" not in st.secrets:
-        st.error("Secretsに認証情報が設定されていません。")
-        return None
-    try:
-        raw = st.secrets["ENCODED_JSON"]
-        clean_b64 = re.sub(r'[^A-Za-z0-9+/=]', '', raw)
-        pad = len(clean_b64) % 4
-        if pad:
-            clean_b64 += '=' * (4 - pad)
-        creds_dict = json.loads(base64.b64decode(clean_b64).decode("utf-8"))
-        if "private_key" in creds_dict:
-            pk = creds_dict["private_key"]
-            if "\\n" in pk:
-                pk = pk.replace("\\n", "\n")
-            if not pk.endswith("\n"):
-                pk += "\n"
-            creds_dict["private_key"] = pk
-        creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-        return gspread.authorize(creds)
-    except Exception as e:
-        st.error(f"認証エラー: {e}")
-        return None
+        raise RuntimeError("Secretsに認証情報が設定されていません。")
+    raw = st.secrets["ENCODED_JSON"]
+    clean_b64 = re.sub(r'[^A-Za-z0-9+/=]', '', raw)
+    pad = len(clean_b64) % 4
+    if pad:
+        clean_b64 += '=' * (4 - pad)
+    creds_dict = json.loads(base64.b64decode(clean_b64).decode("utf-8"))
+    if "private_key" in creds_dict:
+        pk = creds_dict["private_key"]
+        if "\\n" in pk:
+            pk = pk.replace("\\n", "\n")
+        if not pk.endswith("\n"):
+            pk += "\n"
+        creds_dict["private_key"] = pk
+    creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
+    return gspread.authorize(creds)
+
+
+@st.cache_resource
+def _open_sheet():
+    return _authorize().open_by_key(SHEET_KEY).sheet1
 
-SHEET_KEY = "1wSfyGreLH_lb7vR_vpmuJ3rAndtMNvMDQbv2ZlPVxUE"
 
 def get_sheet():
-    client = get_client()
-    if client is None:
-        return None
     try:
-        return client.open_by_key(SHEET_KEY).sheet1
+        return _open_sheet()
     except Exception as e:
-        st.error(f"シートエラー: {e}")
+        st.error(f"認証/シートエラー: {e}")
         return None
 
 
+@st.cache_data(ttl=ROWS_TTL, show_spinner=False)
+def _fetch_rows():
+    return _open_sheet().get_all_records()
+
+
+def _fresh_rows():
+    """このセッションに保持している行（TTL内のものだけ。無ければ None）"""
+    state = st.session_state
+    if "rows" in state and time.time() - state["rows_loaded_at"] <= ROWS_TTL:
+        return state["rows"]
+    return None
+
+
+def get_rows():
+    """このセッションの行データ。TTLを過ぎた時だけ読み直す"""
+    rows = _fresh_rows()
+    if rows is None:
+        rows = st.session_state["rows"] = _fetch_rows()
+        st.session_state["rows_loaded_at"] = time.time()
+    return rows
+
+
+def append_watch(sheet, values):
+    """1行追加し、保持している行にも同じ行を足す"""
+    sheet.append_row(values)
+    _fetch_rows.clear()  # 他のセッションは次回読み直す
+    rows = _fresh_rows()
+    if rows is None:
+        return
+    headers = list(rows[0].keys()) if rows else DEFAULT_HEADERS
+    rows.append(dict(zip(headers, values + [""] * (len(headers) - len(values)))))
+
+
+def _watch_key(word, url, memo):
+    """同じ監視かどうかの判定キー（webapp.py と同じ。URL監視はURL、検索監視はキーワード+サイト名）"""
+    if memo == "HP更新":
+        return ("url", url)
+    return ("kw", word, memo.lower())
+
+
+def _row_key(row):
+    return _watch_key(*(str(row.get(k, "")).strip() for k in ("word", "url", "memo")))
+
+
+def delete_watch(sheet, row_index, row):
+    """row_index の行がまだ row と同じ監視なら削除し、保持している行からも取り除く
+
+    保持している行は最大 ROWS_TTL 秒前のもので、その間に別セッションや webapp.py が行を削除していると
+    行番号が別の監視を指す。違っていたら削除せずに行を読み直させ、False を返す。
+    """
+    headers = sheet.row_values(1)
+    current = dict(zip(headers, sheet.row_values(row_index)))
+    if _row_key(current) != _row_key(row):
+        st.session_state.pop("rows", None)
+        _fetch_rows.clear()
+        return False
+    sheet.delete_rows(row_index)
+    _fetch_rows.clear()
+    rows = _fresh_rows()
+    if rows is not None and 0 <= row_index - 2 < len(rows):
+        del rows[row_index - 2]
+    return True
+
+
 # ============================================================
 # タイトル
 # ============================================================
@@ -156,7 +222,8 @@ with col_t:
     st.markdown("# Web更新チェッカー")
 with col_r:
     if st.button("🔄", help="データ再読込"):
-        st.cache_resource.clear()
+        st.session_state.pop("rows", None)
+        _fetch_rows.clear()
         st.rerun()
 
 # ============================================================
@@ -188,10 +255,9 @@ if show_form == "url":
             if submitted and target_url:
                 sheet = get_sheet()
                 if sheet:
-                    sheet.append_row(["update", target_url, "HP更新", freq, "", ""])
+                    append_watch(sheet, ["update", target_url, "HP更新", freq, "", ""])
                     st.success("URL監視を追加しました")
                     st.session_state["show_form"] = None
-                    st.cache_resource.clear()
                     st.rerun()
 
 elif show_form == "kw":
@@ -205,10 +271,9 @@ elif show_form == "kw":
             if submitted and keyword:
                 sheet = get_sheet()
                 if sheet:
-                    sheet.append_row([keyword, "", source, freq, "", ""])
+                    append_watch(sheet, [keyword, "", source, freq, "", ""])
                     st.success("検索監視を追加しました")
                     st.session_state["show_form"] = None
-                    st.cache_resource.clear()
                     st.rerun()
 
 # ============================================================
@@ -217,7 +282,7 @@ elif show_form == "kw":
 sheet = get_sheet()
 if sheet:
     try:
-        rows = sheet.get_all_records()
+        rows = get_rows()
     except Exception:
         rows = []
 
@@ -225,11 +290,14 @@ if sheet:
         st.markdown(f'<div class="section-title">監視中 ({len(rows)}件)</div>',
                     unsafe_allow_html=True)
 
+        # カードを描画しながら、下の「最新ステータス」用のHTMLも同じループで組み立てる
+        status_html = []
         for i, row in enumerate(rows, start=2):
             word = str(row.get("word", ""))
-            url = str(row.get("url", ""))
+            url = str(row.get("url", "")).strip()
             memo = str(row.get("memo", ""))
             freq = str(row.get("freq", ""))
+            prev_hash = str(row.get("prev_hash", "")).strip()
 
             is_url_watch = (memo == "HP更新")
 
@@ -238,11 +306,16 @@ if sheet:
                 icon = "🌐"
                 title = url if url else "(URL未設定)"
                 sub = f"{freq}時間ごと"
+                label = url[:40] if url else word
+                status = "✅ 監視中" if prev_hash else "⏳ 初回チェック待ち"
             else:
                 icon_cls = "card-icon-kw"
                 icon = "🔍"
                 title = word
                 sub = f"{freq}時間ごと・{memo}"
+                label = word
+                status = "✅ URL生成済" if url else "⏳ URL未生成"
+            status_html.append(f'<div class="history-row">{label} — {status}</div>')
 
             col_card, col_del = st.columns([10, 1])
             with col_card:
@@ -257,42 +330,17 @@ if sheet:
                 ''', unsafe_allow_html=True)
             with col_del:
                 if st.button("🗑", key=f"del_{i}", help="削除"):
-                    sheet.delete_rows(i)
-                    st.cache_resource.clear()
+                    delete_watch(sheet, i, row)
                     st.rerun()
-    else:
-        st.info("監視項目がありません。上のボタンから追加してください。")
 
-    # ============================================================
-    # 履歴セクション（直近の実行ログから作成）
-    # ============================================================
-    # Google Sheetsのデータから簡易的に状態を表示
-    if rows:
-        st.markdown('<div class="section-title">最新ステータス</div>',
+        # ============================================================
+        # 履歴セクション（直近の実行ログから作成）
+        # ============================================================
+        # Google Sheetsのデータから簡易的に状態を表示
+        st.markdown('<div class="section-title">最新ステータス</div>' + "".join(status_html),
                     unsafe_allow_html=True)
-        for row in rows:
-            word = str(row.get("word", ""))
-            memo = str(row.get("memo", ""))
-            prev_hash = str(row.get("prev_hash", "")).strip()
-            url = str(row.get("url", "")).strip()
-            is_url_watch = (memo == "HP更新")
-
-            if is_url_watch:
-                label = url[:40] if url else word
-                if prev_hash:
-                    status = "✅ 監視中"
-                else:
-                    status = "⏳ 初回チェック待ち"
-            else:
-                label = word
-                if url:
-                    status = f"✅ URL生成済"
-                else:
-                    status = "⏳ URL未生成"
-
-            st.markdown(
-                f'<div class="history-row">{label} — {status}</div>',
-                unsafe_allow_html=True)
+    else:
+        st.info("監視項目がありません。上のボタンから追加してください。")
 
 else:
     st.warning("Google Sheetsに接続できません。Secretsの設定を確認してください。")
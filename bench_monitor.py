@@ -0,0 +1,419 @@
+"""monitor.main() のベンチマーク — ネットワーク不要
+
+ローカルの擬似Webサーバー（遅延・エラー・304を設定可能）と、
+gspreadワークシート / LINE APIのインメモリ偽物を使って monitor.main() を実行し、
+行数ごとの実行時間・req/s・Sheets API呼び出し回数・ピークRSS（本体・解析プロセス）・ステージ別時間を出力する。
+
+使い方:
+    python bench_monitor.py                          # 10/100/1000行
+    python bench_monitor.py --rows 100 --latency-ms 200 --error-rate 0.05
+    python bench_monitor.py --pages recorded/ --json # 記録済みHTMLを配信、結果はJSON
+    python bench_monitor.py --startup --rows 100     # 期限の来た行が無い実行の起動時間
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HEADERS = ["word", "url", "memo", "count", "prev_hash", "prev_len"]
+
+
+# ============================================================
+# 擬似Webサーバー
+# ============================================================
+class FakeWeb:
+    """記録済み(または合成)ページを配信するローカルHTTPサーバー
+
+    - latency_ms: 1リクエストごとの応答遅延
+    - error_rate: 500を返す確率
+    - etag: ETagを付与し、条件付きリクエストには304を返す
+    - feeds: 各ページに <link rel="alternate"> でRSS(/feed/<n>)を載せる
+    - /v2/bot/message/push: LINE Messaging APIの代わりに受信件数だけ数える
+    """
+
+    def __init__(self, pages_dir=None, page_chars=8000, latency_ms=0, error_rate=0.0,
+                 etag=True, feeds=False, seed=0):
+        self.page_chars = page_chars
+        self.feeds = feeds
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.etag = etag
+        self.rand = random.Random(seed)
+        self.recorded = []
+        if pages_dir:
+            for name in sorted(os.listdir(pages_dir)):
+                with open(os.path.join(pages_dir, name), encoding="utf-8", errors="replace") as f:
+                    self.recorded.append(f.read())
+        self.versions = {}
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "bytes": 0, "errors": 0, "not_modified": 0, "line": 0}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def bump(self, ratio):
+        """全ページのうち ratio の割合を新しい版に更新する"""
+        # 取得順（並列取得だと毎回変わる）に左右されないよう、パス順に乱数を割り当てる
+        for path in sorted(self.versions):
+            if self.rand.random() < ratio:
+                self.versions[path] += 1
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counts[key] += n
+
+    def render(self, path):
+        n = int(path.rsplit("/", 1)[-1] or 0)
+        if path.startswith("/feed/"):
+            return self.render_feed(n)
+        version = self.versions.setdefault(path, 0)
+        if self.recorded:
+            base = self.recorded[n % len(self.recorded)]
+            return base.replace("</body>", f"<p>v{version}</p></body>")
+        # 合成ページ: 本文のほかに抽出で捨てられるノイズ要素も含める
+        # 版が上がるごとに新着記事が1件ずつ増える（軽微変更フィルタを超える差分）
+        words = [f"記事{n}-{k} 本文テキストのサンプルです。" for k in range(self.page_chars // 20)]
+        news = [f"新着{n}-{v} " + "お知らせの本文です。" * 6 for v in range(version)]
+        return (
+            "<html><head><style>body{color:#333}</style><script>var x=1;</script>"
+            + (f'<link rel="alternate" type="application/rss+xml" href="/feed/{n}">' if self.feeds else "")
+            + "</head><body>"
+            "<header>ヘッダー</header><nav><a href='/'>トップ</a></nav>"
+            + "".join(f"<p>{w}</p>" for w in news + words)
+            + "<footer>フッター</footer></body></html>"
+        )
+
+    def render_feed(self, n):
+        """ページ n の新着記事をRSSにしたもの（版が上がると item が1件増える）"""
+        version = self.versions.setdefault(f"/page/{n}", 0)
+        items = "".join(
+            f"<item><title>新着{n}-{v}</title><guid>{self.base_url}/page/{n}#{v}</guid>"
+            f"<pubDate>Mon, 0{1 + v % 9} Jun 2026 00:00:00 +0000</pubDate></item>"
+            for v in range(version + 1)
+        )
+        return f'<?xml version="1.0"?><rss version="2.0"><channel><title>feed{n}</title>{items}</channel></rss>'
+
+    def _handler(self):
+        web = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # keep-alive接続でヘッダーと本文が別送信になるため、Nagleによる40ms待ちを避ける
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b"", headers=None):
+                self.send_response(status)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                web.count("line")
+                self._send(200, b"{}", {"Content-Type": "application/json"})
+
+            def do_GET(self):
+                web.count("requests")
+                if web.latency:
+                    time.sleep(web.latency)
+                if web.error_rate and web.rand.random() < web.error_rate:
+                    web.count("errors")
+                    self._send(500, b"error")
+                    return
+                body = web.render(self.path).encode("utf-8")
+                tag = '"' + hashlib.md5(body).hexdigest() + '"'
+                ctype = "application/rss+xml" if self.path.startswith("/feed/") else "text/html"
+                headers = {"Content-Type": f"{ctype}; charset=utf-8"}
+                if web.etag:
+                    headers["ETag"] = tag
+                    if self.headers.get("If-None-Match") == tag:
+                        web.count("not_modified")
+                        self._send(304, headers=headers)
+                        return
+                web.count("bytes", len(body))
+                self._send(200, body, headers)
+
+        return Handler
+
+
+# ============================================================
+# gspread ワークシートの偽物
+# ============================================================
+def _numericise(value):
+    """gspread.get_all_records と同様に整数文字列を数値に変換"""
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return value
+
+
+def _a1_to_rowcol(a1):
+    """"B5" → (5, 2)。行を省略した "D" は (0, 4)"""
+    letters = a1.rstrip("0123456789")
+    col = 0
+    for ch in letters:
+        col = col * 26 + ord(ch) - 64
+    return int(a1[len(letters):] or 0), col
+
+
+class FakeWorksheet:
+    """gspread.Worksheet のうち monitor / webapp が使うメソッドだけを持つインメモリ実装
+
+    呼び出し回数をメソッド名ごとに api_calls に記録し、latency_ms で1呼び出しの遅延を模擬する。
+    """
+
+    def __init__(self, values, latency_ms=0):
+        self.values = [list(r) for r in values]
+        self.latency = latency_ms / 1000
+        self.api_calls = {}
+
+    def _call(self, name):
+        self.api_calls[name] = self.api_calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def row_values(self, row):
+        self._call("row_values")
+        return list(self.values[row - 1]) if row <= len(self.values) else []
+
+    def get_all_values(self):
+        self._call("get_all_values")
+        return [list(r) for r in self.values]
+
+    def get(self, range_name):
+        """A1形式の範囲（"A2:D" のように終端行省略可）の値を返す"""
+        self._call("get")
+        start, _, end = range_name.partition(":")
+        r1, c1 = _a1_to_rowcol(start)
+        r2, c2 = _a1_to_rowcol(end or start)
+        rows = self.values[r1 - 1:(r2 or len(self.values))]
+        return [r[c1 - 1:c2] for r in rows]
+
+    def get_all_records(self):
+        self._call("get_all_records")
+        headers = self.values[0]
+        records = []
+        for r in self.values[1:]:
+            r = r + [""] * (len(headers) - len(r))
+            records.append({h: _numericise(v) for h, v in zip(headers, r)})
+        return records
+
+    def _set(self, row, col, value):
+        while len(self.values) < row:
+            self.values.append([])
+        r = self.values[row - 1]
+        r.extend([""] * (col - len(r)))
+        r[col - 1] = str(value)
+
+    def update_cell(self, row, col, value):
+        self._call("update_cell")
+        self._set(row, col, value)
+
+    def batch_update(self, data, **kwargs):
+        """[{"range": "B5", "values": [[...]]}, ...] をまとめて1回の呼び出しで書き込む"""
+        self._call("batch_update")
+        for item in data:
+            row, col = _a1_to_rowcol(item["range"].partition(":")[0])
+            for dr, values in enumerate(item["values"]):
+                for dc, value in enumerate(values):
+                    self._set(row + dr, col + dc, value)
+
+    def append_row(self, values, **kwargs):
+        self._call("append_row")
+        self.values.append([str(v) for v in values])
+
+    def append_rows(self, values, **kwargs):
+        self._call("append_rows")
+        self.values.extend([str(v) for v in r] for r in values)
+
+    def delete_rows(self, start, end=None):
+        self._call("delete_rows")
+        del self.values[start - 1:(end or start)]
+
+
+def make_sheet(n_rows, base_url, latency_ms=0):
+    """HP更新と検索監視を混ぜた n_rows 行の監視設定シートを作る"""
+    values = [list(HEADERS)]
+    for i in range(n_rows):
+        url = f"{base_url}/page/{i}"
+        if i % 4 == 3:
+            values.append([f"キーワード{i}", url, "x", "1", "", ""])
+        else:
+            values.append(["update", url, "HP更新", "1", "", ""])
+    return FakeWorksheet(values, latency_ms=latency_ms)
+
+
+# ============================================================
+# 計測
+# ============================================================
+def run_once(monitor, sheet, web):
+    """main() を1回実行して、実行時間とカウンタの差分を返す"""
+    before_calls = sum(sheet.api_calls.values())
+    before = dict(web.counts)
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        monitor.main(sheet=sheet)
+    wall = time.perf_counter() - t0
+    delta = {k: web.counts[k] - before[k] for k in web.counts}
+    return {
+        "wall_s": round(wall, 3),
+        "req_per_s": round(delta["requests"] / wall, 1) if wall else 0.0,
+        "sheets_calls": sum(sheet.api_calls.values()) - before_calls,
+        "http": delta,
+        "stages_s": {k: round(st["total"] / 1000, 3)
+                     for k, st in monitor.metrics.summary()["stages_ms"].items()},
+    }
+
+
+def run_child(args):
+    """1つの行数について計測する（ピークRSSを分けるため別プロセスで実行される）"""
+    os.environ["LINE_CHANNEL_TOKEN"] = "bench"
+    os.environ["LINE_USER_ID"] = "bench"
+    os.environ.pop("GEMINI_API_KEY", None)
+    os.environ.pop("METRICS_PATH", None)
+    os.environ.pop("GITHUB_STEP_SUMMARY", None)
+    import monitor
+
+    with FakeWeb(args.pages, args.page_chars, args.latency_ms, args.error_rate,
+                 etag=not args.no_etag, feeds=args.feeds, seed=args.seed) as web:
+        monitor.LINE_PUSH_URL = web.base_url + "/v2/bot/message/push"
+        sheet = make_sheet(args.child, web.base_url, args.sheets_latency_ms)
+
+        cold = run_once(monitor, sheet, web)
+        web.bump(args.change_ratio)
+        warm = run_once(monitor, sheet, web)
+
+    # 解析プロセスを終了・回収してから測る（RUSAGE_CHILDREN は回収済みの子のうち最大のRSS）
+    if monitor._parse_pool is not None:
+        monitor._parse_pool.shutdown(wait=True)
+        monitor._parse_pool = None
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {"rows": args.child, "cold": cold, "warm": warm, "peak_rss_mb": round(peak_kb / 1024, 1),
+            "parse_worker_rss_mb": round(child_kb / 1024, 1)}
+
+
+HEAVY_MODULES = ("gspread", "google.auth", "google.generativeai", "requests", "bs4")
+
+
+def run_startup_child(args):
+    """期限の来た行が無い実行を模擬して、読み込まれた重いモジュールを返す"""
+    import monitor
+    monitor.should_run_now = lambda row, current_hour: False
+    sheet = make_sheet(args.rows[0], "http://127.0.0.1:9")
+    with contextlib.redirect_stdout(io.StringIO()):
+        monitor.main(sheet=sheet)
+    return {"loaded": [m for m in HEAVY_MODULES if m in sys.modules]}
+
+
+def bench_startup(args):
+    """起動時間: import monitor のみ / 期限の来た行が無い main() 1回（認証・Sheets通信は除く）
+
+    どちらもインタプリタ起動から終了までを別プロセスで測り、中央値を返す。
+    """
+    def median_wall(cmd):
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            out = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            times.append(time.perf_counter() - t0)
+        return round(sorted(times)[len(times) // 2], 3), out.stdout
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    bare, _ = median_wall([sys.executable, "-c", "pass"])
+    imp, _ = median_wall([sys.executable, "-c", f"import sys; sys.path.insert(0, {here!r}); import monitor"])
+    run, out = median_wall([sys.executable, os.path.abspath(__file__), "--startup-child",
+                            "--rows", str(args.rows[0])])
+    loaded = json.loads(out.strip().splitlines()[-1])["loaded"]
+    return {"python_s": bare, "import_monitor_s": imp, "no_due_run_s": run,
+            "rows": args.rows[0], "heavy_modules_loaded": loaded}
+
+
+def print_table(results):
+    print(f"{'rows':>6} {'run':>5} {'wall[s]':>8} {'req/s':>8} {'sheets':>7} {'rss[MB]':>8} {'worker[MB]':>10}  stages[s]")
+    for r in results:
+        for run in ("cold", "warm"):
+            m = r[run]
+            stages = " ".join(f"{k}={v}" for k, v in m["stages_s"].items())
+            print(f"{r['rows']:>6} {run:>5} {m['wall_s']:>8} {m['req_per_s']:>8} "
+                  f"{m['sheets_calls']:>7} {r['peak_rss_mb']:>8} {r['parse_worker_rss_mb']:>10}  {stages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="monitor.main() ベンチマーク")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--pages", help="配信する記録済みHTMLのディレクトリ（省略時は合成ページ）")
+    parser.add_argument("--page-chars", type=int, default=8000, help="合成ページの本文文字数")
+    parser.add_argument("--latency-ms", type=float, default=0, help="擬似サーバーの応答遅延")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500を返す確率")
+    parser.add_argument("--no-etag", action="store_true", help="ETag/304を無効にする")
+    parser.add_argument("--feeds", action="store_true", help="各ページにRSSフィードを付ける")
+    parser.add_argument("--sheets-latency-ms", type=float, default=0, help="Sheets API 1呼び出しの遅延")
+    parser.add_argument("--change-ratio", type=float, default=0.1, help="2回目の実行前に更新するページの割合")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    parser.add_argument("--startup", action="store_true", help="起動時間だけを測る")
+    parser.add_argument("--repeat", type=int, default=5, help="--startup の繰り返し回数")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--startup-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(run_child(args)))
+        return
+    if args.startup_child:
+        print(json.dumps(run_startup_child(args)))
+        return
+    if args.startup:
+        result = bench_startup(args)
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+        else:
+            for k, v in result.items():
+                print(f"{k:>22}: {v}")
+        return
+
+    results = []
+    passthrough = [a for a in sys.argv[1:] if a != "--json"]
+    for n in args.rows:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", str(n)] + passthrough,
+            capture_output=True, text=True, check=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
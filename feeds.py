@@ -0,0 +1,113 @@
+"""RSS / Atom / サイトマップの検出と解析
+
+HP更新の監視対象がフィードを公開していれば、ページ全体のHTMLの代わりにフィードを
+条件付きリクエスト(ETag / Last-Modified)で取得し、エントリのID・更新日時だけを比較する。
+"""
+import hashlib
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin, urlparse
+
+FEED_TYPES = ("application/rss+xml", "application/atom+xml", "application/rdf+xml")
+# ルート要素 → エントリ要素
+FEED_ROOTS = {"rss": "item", "RDF": "item", "feed": "entry", "urlset": "url", "sitemapindex": "sitemap"}
+ID_TAGS = ("guid", "id", "loc", "link")
+TIME_TAGS = ("updated", "published", "pubDate", "lastmod", "date")
+XML_ENCODING_RE = re.compile(rb"""\s*<\?xml[^>]*\bencoding\s*=\s*["']([A-Za-z0-9._-]+)["']""")
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def discover_feed_links(html, page_url):
+    """HTMLの <link rel="alternate" type="application/rss+xml"> 等からフィードURLを列挙"""
+    from bs4 import BeautifulSoup, SoupStrainer
+    soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer("link"))
+    links = []
+    for link in soup.find_all("link", href=True):
+        rel = [r.lower() for r in (link.get("rel") or [])]
+        ftype = (link.get("type") or "").split(";")[0].strip().lower()
+        if "alternate" in rel and ftype in FEED_TYPES:
+            links.append(urljoin(page_url, link["href"]))
+    return links
+
+
+def sitemap_candidate(page_url):
+    """サイトのトップページを監視している場合だけ /sitemap.xml を候補にする"""
+    parsed = urlparse(page_url)
+    if parsed.path in ("", "/") and not parsed.query:
+        return f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"
+    return None
+
+
+def _parse_declared_encoding(content):
+    """XML宣言の encoding でデコードして解析する。読めなければ None"""
+    m = XML_ENCODING_RE.match(content)
+    if not m:
+        return None
+    try:
+        return ET.fromstring(content.decode(m.group(1).decode("ascii"), errors="replace"))
+    except (LookupError, ValueError, ET.ParseError):
+        return None
+
+
+def parse_feed(content):
+    """フィード/サイトマップを解析して [(id, 更新日時, タイトル), ...] を返す。フィードでなければ None"""
+    try:
+        root = ET.fromstring(content)
+    except ET.ParseError:
+        return None
+    except (ValueError, LookupError):
+        # expat は Shift_JIS / EUC-JP などのマルチバイト宣言を扱えないので、宣言どおりに文字列にしてから解析する
+        root = _parse_declared_encoding(content)
+        if root is None:
+            return None
+    entry_tag = FEED_ROOTS.get(_local(root.tag))
+    if entry_tag is None:
+        return None
+
+    entries = []
+    for el in root.iter():
+        if _local(el.tag) != entry_tag:
+            continue
+        fields = {}
+        for child in el:
+            name = _local(child.tag)
+            text = (child.text or "").strip()
+            # Atomの <link href="..."/> は属性にURLがある
+            if name == "link" and not text:
+                text = child.get("href", "")
+            if text and name not in fields:
+                fields[name] = text
+        entry_id = next((fields[t] for t in ID_TAGS if t in fields), "")
+        updated = next((fields[t] for t in TIME_TAGS if t in fields), "")
+        if entry_id or updated:
+            entries.append((entry_id, updated, fields.get("title", "")))
+    return entries
+
+
+def feed_fingerprint(entries):
+    """エントリのIDと更新日時から作るハッシュ（並び順やタイトルの揺れは無視）"""
+    lines = sorted(f"{entry_id}\t{updated}" for entry_id, updated, _ in entries)
+    return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+
+
+def _timestamp(value):
+    """RFC 822 (RSS) / ISO 8601 (Atom・サイトマップ) の日時を比較用の数値に。読めなければ0"""
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        pass
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return 0.0
+    return dt.timestamp()
+
+
+def newest_entry(entries):
+    """更新日時が最も新しいエントリ（日時が無ければ先頭）"""
+    return max(entries, key=lambda e: _timestamp(e[1])) if entries else None
@@ -1,11 +1,12 @@
-import os, json, base64, re, hashlib
-import gspread
-import google.generativeai as genai
-from google.oauth2.service_account import Credentials
-import requests
-from bs4 import BeautifulSoup
+import os, sys, json, base64, re, hashlib, math, time, queue, threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from urllib.parse import quote
 
+# gspread / google-auth / google.generativeai / requests / bs4 は読み込みが重いので、
+# 実際に必要になった関数の中で import する（期限の来た行が無い実行では Gemini・HTML系を読まない）
+
 # --- サイト名→ドメイン名の対応表（webapp.pyと共通） ---
 SITE_DOMAINS = {
     "x": None, "twitter": None, "youtube": None, "google": None,
@@ -29,6 +30,9 @@ DIRECT_TEMPLATES = {
     "google": "https://www.google.com/search?q={word}",
 }
 
+SHEET_KEY = "1wSfyGreLH_lb7vR_vpmuJ3rAndtMNvMDQbv2ZlPVxUE"
+LINE_PUSH_URL = "https://api.line.me/v2/bot/message/push"
+
 # --- 軽微変更の閾値 (大規模サイトのみ適用) ---
 MIN_CHANGE_CHARS = 50
 MIN_CHANGE_RATIO = 0.05
@@ -36,6 +40,170 @@ MIN_CHANGE_RATIO = 0.05
 # (ニュースサイトのトップ等、テキスト量が少ないがコンテンツが入れ替わるもの)
 SMALL_PAGE_THRESHOLD = 5000
 
+# --- 常駐モード ---
+# python monitor.py --daemon で起動。シートの設定列はこの間隔(秒)で差分だけ読み直す
+CONFIG_POLL_SECONDS = int(os.environ.get("CONFIG_POLL_SECONDS", 300))
+CONFIG_COLUMNS = ("word", "url", "memo", "count", "freq")
+# シートに自動追加する状態列
+# feed_url: 空=未検出 / "none"=フィード無し(HTMLを比較) / URL=そのフィードを比較
+STATE_COLUMNS = ("prev_hash", "prev_len", "feed_url", "feed_etag", "feed_modified")
+NO_FEED = "none"
+_http_session = None
+_gemini_model = None
+
+# --- 並列パイプライン ---
+# 期限の来た行がこの数以上なら、取得(スレッド)・解析(プロセス)・書き込みを並列に流す
+PIPELINE_MIN_ROWS = int(os.environ.get("PIPELINE_MIN_ROWS", 20))
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", 8))
+PARSE_PROCESSES = int(os.environ.get("PARSE_PROCESSES") or os.cpu_count() or 1)
+# 段の間に溜める最大件数（取得済みで解析待ち / 解析中で書き込み待ち）
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 32))
+_parse_pool = None
+
+# --- スナップショット ---
+# SNAPSHOT_DIR を設定すると抽出済み本文を内容ハッシュ単位で差分圧縮保存する
+# （replay.py での閾値再評価と、LINE通知への差分要約に使う）
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR")
+_snapshot_store = None
+
+# --- 計測 ---
+# METRICS_PATH を設定すると1実行ごとにJSON-lines形式で計測結果を追記する
+# GitHub Actions上では GITHUB_STEP_SUMMARY にも集計表を書き出す
+METRICS_PATH = os.environ.get("METRICS_PATH")
+STAGES = ("fetch", "decode", "extract", "fingerprint", "snapshot", "llm", "sheet_write", "notify")
+COUNTERS = ("http_requests", "http_errors", "bytes_downloaded", "not_modified",
+            "sheets_api_calls", "llm_calls", "notifications")
+
+
+def _percentile(sorted_values, p):
+    """ソート済みリストのパーセンタイル（nearest-rank）"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+class RunMetrics:
+    """1回の実行分の行ごと・ステージごとの所要時間とカウンタ"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.rows = {}
+        self.counters = {name: 0 for name in COUNTERS}
+        # パイプライン処理では取得スレッドからも更新される
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, row_index, name):
+        """with metrics.stage(i, "fetch"): ... で行 i のステージ時間を加算する"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(row_index, name, time.perf_counter() - t0)
+
+    def add(self, row_index, name, seconds):
+        """別プロセスで測った時間などを行 i のステージ時間に加算する"""
+        with self._lock:
+            durations = self.rows.setdefault(row_index, {})
+            durations[name] = durations.get(name, 0.0) + seconds
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        """ステージ別のパーセンタイル(ms)とカウンタをまとめた辞書"""
+        stages = {}
+        for name in STAGES:
+            values = sorted(d[name] * 1000 for d in self.rows.values() if name in d)
+            if not values:
+                continue
+            stages[name] = {
+                "n": len(values),
+                "total": round(sum(values), 1),
+                "p50": round(_percentile(values, 50), 1),
+                "p90": round(_percentile(values, 90), 1),
+                "p99": round(_percentile(values, 99), 1),
+                "max": round(values[-1], 1),
+            }
+        return {
+            "started_at": round(self.started_at, 3),
+            "wall_ms": round((time.perf_counter() - self._t0) * 1000, 1),
+            "rows": len(self.rows),
+            "stages_ms": stages,
+            "counters": dict(self.counters),
+        }
+
+    def record(self):
+        """JSON-lines 1行分の計測レコード（集計 + 行ごとの生データ）"""
+        rec = self.summary()
+        rec["row_stages_ms"] = {
+            str(i): {k: round(v * 1000, 1) for k, v in d.items()} for i, d in sorted(self.rows.items())
+        }
+        return rec
+
+    def write_jsonl(self, path):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.record(), ensure_ascii=False) + "\n")
+
+    def write_step_summary(self, path):
+        """GitHub Actions のジョブサマリー用Markdownを追記する"""
+        s = self.summary()
+        lines = [
+            "### monitor.py 実行計測",
+            "",
+            f"行数: {s['rows']} / 実行時間: {s['wall_ms'] / 1000:.1f}s",
+            "",
+            "| stage | n | p50 ms | p90 ms | p99 ms | max ms | total ms |",
+            "|---|---:|---:|---:|---:|---:|---:|",
+        ]
+        for name, st in s["stages_ms"].items():
+            lines.append(f"| {name} | {st['n']} | {st['p50']} | {st['p90']} | {st['p99']} "
+                         f"| {st['max']} | {st['total']} |")
+        lines += ["", "| counter | value |", "|---|---:|"]
+        lines += [f"| {k} | {v} |" for k, v in s["counters"].items()]
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def flush(self):
+        """設定された出力先に計測結果を書き出す（失敗しても本処理には影響させない）"""
+        try:
+            if METRICS_PATH:
+                self.write_jsonl(METRICS_PATH)
+            summary_path = os.environ.get("GITHUB_STEP_SUMMARY")
+            if summary_path:
+                self.write_step_summary(summary_path)
+        except OSError as e:
+            print(f"計測結果の書き出し失敗: {e}")
+
+
+metrics = RunMetrics()
+
+
+class _MeteredSheet:
+    """Worksheetへの呼び出し回数を数え、update_cellの時間を行ごとに記録するラッパー
+
+    状態列の batch_update は save_row_state 側で行ごとに計測する。
+    """
+
+    def __init__(self, sheet):
+        self._sheet = sheet
+
+    def __getattr__(self, name):
+        attr = getattr(self._sheet, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            metrics.incr("sheets_api_calls")
+            if name == "update_cell" and args and args[0] >= 2:
+                with metrics.stage(args[0], "sheet_write"):
+                    return attr(*args, **kwargs)
+            return attr(*args, **kwargs)
+        return call
+
 
 def get_credentials():
     """GitHub Secret / 環境変数からGCP認証情報を取得"""
@@ -71,9 +239,25 @@ def get_credentials():
         "https://www.googleapis.com/auth/spreadsheets",
         "https://www.googleapis.com/auth/drive",
     ]
+    from google.oauth2.service_account import Credentials
     return Credentials.from_service_account_info(creds_info, scopes=scopes)
 
 
+def get_http_session():
+    """接続プールを使い回すHTTPセッション（常駐モードでは実行をまたいで再利用）"""
+    global _http_session
+    if _http_session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        _http_session = requests.Session()
+        _http_session.headers["User-Agent"] = "web-watcher/1.0"
+        # 取得スレッド数ぶん同じホストへの接続を保持できるようにする
+        adapter = HTTPAdapter(pool_maxsize=max(10, FETCH_WORKERS))
+        _http_session.mount("http://", adapter)
+        _http_session.mount("https://", adapter)
+    return _http_session
+
+
 def send_line_notification(message):
     """LINE Messaging APIでプッシュ通知を送る"""
     token = os.environ.get("LINE_CHANNEL_TOKEN")
@@ -82,8 +266,8 @@ def send_line_notification(message):
         print("LINE通知スキップ: TOKEN/USER_IDが未設定")
         return
 
-    resp = requests.post(
-        "https://api.line.me/v2/bot/message/push",
+    resp = get_http_session().post(
+        LINE_PUSH_URL,
         headers={
             "Content-Type": "application/json",
             "Authorization": f"Bearer {token}",
@@ -101,6 +285,7 @@ def send_line_notification(message):
 
 def extract_body_text(html):
     """HTMLから本文テキストだけ抽出（ノイズ除去）"""
+    from bs4 import BeautifulSoup
     soup = BeautifulSoup(html, "html.parser")
     for tag in soup(["script", "style", "nav", "footer", "header", "noscript", "iframe"]):
         tag.decompose()
@@ -115,58 +300,218 @@ def get_col_index(headers, name):
         return None
 
 
-def check_site_update(sheet, row_index, row, col_map):
-    """サイト更新チェック。軽微変更はスキップ、閾値超えたらLINE通知"""
+def save_row_state(sheet, row_index, row, col_map, **values):
+    """状態列をシートに書き込み、メモリ上の row も更新する（常駐モードで再読込を省くため）
+
+    Sheets APIは書き込み回数の上限が厳しいので、1行分の変更は1回の batch_update にまとめる。
+    """
+    cells = []
+    for name, value in values.items():
+        col = col_map.get(name)
+        if col:
+            cells.append({"range": f"{_column_letter(col)}{row_index}", "values": [[value]]})
+        row[name] = value
+    if cells:
+        with metrics.stage(row_index, "sheet_write"):
+            sheet.batch_update(cells)
+
+
+def classify_change(prev_len, current_len, min_chars=MIN_CHANGE_CHARS,
+                    min_ratio=MIN_CHANGE_RATIO, small_page=SMALL_PAGE_THRESHOLD):
+    """ハッシュが変わった時の差分量判定。(軽微変更か, 変化文字数, 変化率) を返す
+
+    前回の文字数が不明(None)か、前回が small_page 以下の小さいページなら軽微扱いしない。
+    replay.py の閾値スイープからも同じ判定を使う。
+    """
+    if prev_len is None:
+        return False, current_len, 1.0
+    change_chars = abs(current_len - prev_len)
+    change_ratio = change_chars / max(prev_len, 1)
+    minor = prev_len > small_page and change_chars < min_chars and change_ratio < min_ratio
+    return minor, change_chars, change_ratio
+
+
+def get_snapshot_store():
+    """SNAPSHOT_DIR が設定されていればスナップショット保存先を返す"""
+    global _snapshot_store
+    if SNAPSHOT_DIR and _snapshot_store is None:
+        from snapshots import SnapshotStore
+        _snapshot_store = SnapshotStore(SNAPSHOT_DIR)
+    return _snapshot_store
+
+
+def decode_html(content, encoding):
+    """バイト列をrequestsの Response.text と同じ規則で文字列にする（ヘッダーに文字コードが無ければ推定）"""
+    if encoding is None:
+        from requests.compat import chardet
+        encoding = chardet.detect(content)["encoding"] if chardet is not None else "utf-8"
+    try:
+        return str(content, encoding or "utf-8", errors="replace")
+    except (LookupError, TypeError):
+        return str(content, errors="replace")
+
+
+def fetch_row(row_index, row, col_map):
+    """取得ステージ: 行のページ（フィードが見つかっている行はフィード）を取得する
+
+    パイプラインでは取得スレッドから呼ぶので、シートへの書き込みやログ出力はしない。
+    戻り値の dict: kind ("skip" / "html" / "feed")、取得できれば content(生のバイト列)、
+    失敗なら error、304なら not_modified。フィード未探索の行はここでフィードを探して取得し、
+    見つかれば discovered=True のフィードの job を返す。
+    """
     url = str(row.get('url', '')).strip()
     if not url.startswith('http'):
-        print(f"  行{row_index}: URLが未設定、スキップ")
-        return
+        return {"kind": "skip", "url": url}
 
+    # HP更新でフィードが見つかっている行はフィードだけを見る
+    is_hp = str(row.get('memo', '')).strip() == "HP更新"
+    feed_url = str(row.get('feed_url', '')).strip()
+    if is_hp and feed_url.startswith('http'):
+        job = {"kind": "feed", "url": url, "feed_url": feed_url}
+        try:
+            with metrics.stage(row_index, "fetch"):
+                resp = fetch_feed(feed_url, str(row.get('feed_etag', '')).strip(),
+                                  str(row.get('feed_modified', '')).strip())
+        except Exception as e:
+            metrics.incr("http_errors")
+            job["error"] = e
+            return job
+        if resp is None:
+            job["not_modified"] = True
+            return job
+        job["content"] = resp.content
+        job["validators"] = {"feed_etag": resp.headers.get("ETag", ""),
+                             "feed_modified": resp.headers.get("Last-Modified", "")}
+        return job
+
+    # 初回（feed_url 未設定）はフィードを探し、見つかれば次回からフィード監視に切り替える
+    job = {"kind": "html", "url": url, "discover": is_hp and not feed_url and 'feed_url' in col_map}
+    metrics.incr("http_requests")
     try:
-        resp = requests.get(url, timeout=15, headers={"User-Agent": "web-watcher/1.0"})
-        resp.raise_for_status()
+        with metrics.stage(row_index, "fetch"):
+            resp = get_http_session().get(url, timeout=15)
+            resp.raise_for_status()
     except Exception as e:
-        print(f"  行{row_index}: HTML取得失敗 ({e})")
+        metrics.incr("http_errors")
+        job["error"] = e
+        return job
+    metrics.incr("bytes_downloaded", len(resp.content))
+    if job["discover"]:
+        feed_job = find_feed(row_index, url, decode_html(resp.content, resp.encoding))
+        if feed_job and "content" in feed_job:
+            return feed_job
+        if feed_job:
+            # リンクされたフィードが一時的に取れないだけなら feed_url は書かず、次回また探す
+            job["discover"] = False
+    job["content"] = resp.content
+    job["encoding"] = resp.encoding
+    # 前回と同じ内容なら本文を解析プロセスから送り返さなくてよい
+    # （スナップショットの最新版が prev_hash と食い違う時は保存用に本文が要る）
+    prev_hash = str(row.get('prev_hash', '')).strip()
+    store = get_snapshot_store()
+    if prev_hash and (store is None or store.last_hash(url) == prev_hash):
+        job["known_hash"] = prev_hash
+    return job
+
+
+def analyze_page(kind, content, encoding=None, known_hash=None):
+    """解析ステージ: デコード → 本文抽出 → ハッシュ（ワーカープロセスで実行する純粋関数）
+
+    生のバイト列を受け取り、ハッシュ・文字数などの小さな結果だけを返す。
+    本文テキストはハッシュが known_hash と違う時だけ返す（スナップショット保存・差分要約用）。
+    """
+    timings = {}
+    t0 = time.perf_counter()
+    if kind == "feed":
+        from feeds import parse_feed, feed_fingerprint, newest_entry
+        entries = parse_feed(content)
+        t1 = time.perf_counter()
+        timings["extract"] = t1 - t0
+        # エントリ0件はまだ記事の無い正しいフィード。None（解析失敗）だけHTML比較に戻す
+        if entries is None:
+            return {"hash": None, "timings": timings}
+        result = {"hash": feed_fingerprint(entries), "length": len(entries),
+                  "latest": newest_entry(entries), "timings": timings}
+        timings["fingerprint"] = time.perf_counter() - t1
+        return result
+
+    html = decode_html(content, encoding)
+    t1 = time.perf_counter()
+    timings["decode"] = t1 - t0
+    result = {"timings": timings}
+    text = extract_body_text(html)
+    t3 = time.perf_counter()
+    timings["extract"] = t3 - t1
+    result["hash"] = hashlib.sha256(text.encode()).hexdigest()
+    result["length"] = len(text)
+    if result["hash"] != known_hash:
+        result["text"] = text
+    timings["fingerprint"] = time.perf_counter() - t3
+    return result
+
+
+def _analyze_job(job):
+    """fetch_row の結果のうち解析プロセスに送る引数"""
+    return job["kind"], job["content"], job.get("encoding"), job.get("known_hash")
+
+
+def apply_row(sheet, row_index, row, col_map, job, result=None):
+    """書き込みステージ: 取得・解析の結果からシート更新とLINE通知を行う（メインスレッドのみ）"""
+    if result:
+        for name, seconds in result["timings"].items():
+            metrics.add(row_index, name, seconds)
+
+    if job["kind"] == "skip":
+        print(f"  行{row_index}: URLが未設定、スキップ")
+    elif job["kind"] == "feed":
+        apply_feed_result(sheet, row_index, row, col_map, job, result)
+    else:
+        apply_page_result(sheet, row_index, row, col_map, job, result)
+
+
+def apply_page_result(sheet, row_index, row, col_map, job, result):
+    """HTMLページの比較結果を反映する。軽微変更はスキップ、閾値超えたらLINE通知"""
+    url = job["url"]
+    if "error" in job:
+        print(f"  行{row_index}: HTML取得失敗 ({job['error']})")
         return
 
-    current_text = extract_body_text(resp.text)
-    current_hash = hashlib.sha256(current_text.encode()).hexdigest()
+    # フィードを探したが無かった行は次回からHTMLだけを比較する（他の状態と一緒に書く）
+    state = {"feed_url": NO_FEED} if job.get("discover") else {}
 
-    prev_hash = str(row.get('prev_hash', '')).strip()
+    current_hash = result["hash"]
+    current_len = result["length"]
+    current_text = result.get("text")
+    store = get_snapshot_store()
+    if store and current_text is not None:
+        with metrics.stage(row_index, "snapshot"):
+            store.put(url, current_text, current_hash)
 
-    col_prev_hash = col_map.get('prev_hash')
-    col_prev_len = col_map.get('prev_len')
+    prev_hash = str(row.get('prev_hash', '')).strip()
 
     if not prev_hash:
-        if col_prev_hash:
-            sheet.update_cell(row_index, col_prev_hash, current_hash)
-        if col_prev_len:
-            sheet.update_cell(row_index, col_prev_len, str(len(current_text)))
+        save_row_state(sheet, row_index, row, col_map,
+                       prev_hash=current_hash, prev_len=str(current_len), **state)
         print(f"  行{row_index}: 初回チェック、ハッシュ保存")
         return
 
     if current_hash == prev_hash:
+        if state:
+            save_row_state(sheet, row_index, row, col_map, **state)
         print(f"  行{row_index}: 変更なし")
         return
 
     # --- 差分量を計算 ---
-    prev_len_str = str(row.get('prev_len', '')).strip()
-    current_len = len(current_text)
-    change_chars = abs(current_len - (int(prev_len_str) if prev_len_str.isdigit() else 0))
-
     # 大きいページのみ軽微変更フィルタを適用
     # 小さいページ（ニュースサイトトップ等）はハッシュ変化で即通知
-    if prev_len_str and prev_len_str.isdigit():
-        prev_len = int(prev_len_str)
-        if prev_len > SMALL_PAGE_THRESHOLD:
-            change_ratio = change_chars / max(prev_len, 1)
-            if change_chars < MIN_CHANGE_CHARS and change_ratio < MIN_CHANGE_RATIO:
-                print(f"  行{row_index}: 軽微変更（{change_chars}文字, {change_ratio:.1%}）スキップ")
-                if col_prev_hash:
-                    sheet.update_cell(row_index, col_prev_hash, current_hash)
-                if col_prev_len:
-                    sheet.update_cell(row_index, col_prev_len, str(current_len))
-                return
+    prev_len_str = str(row.get('prev_len', '')).strip()
+    prev_len = int(prev_len_str) if prev_len_str.isdigit() else None
+    minor, change_chars, change_ratio = classify_change(prev_len, current_len)
+    if minor:
+        print(f"  行{row_index}: 軽微変更（{change_chars}文字, {change_ratio:.1%}）スキップ")
+        save_row_state(sheet, row_index, row, col_map,
+                       prev_hash=current_hash, prev_len=str(current_len), **state)
+        return
 
     # --- 通知 ---
     word = str(row.get('word', ''))
@@ -176,16 +521,269 @@ def check_site_update(sheet, row_index, row, col_map):
     else:
         label = f"{word}（{memo}）"
     msg = f"🔔 サイト更新検知\n{label}\n{url}"
-    send_line_notification(msg)
+    # スナップショットがあれば前回からの差分を要約して添える
+    if store and current_text is not None:
+        old_text = store.get(prev_hash)
+        if old_text is not None:
+            from snapshots import summarize_diff
+            diff_text = summarize_diff(old_text, current_text)
+            if diff_text:
+                msg += f"\n\n{diff_text}"
+    with metrics.stage(row_index, "notify"):
+        send_line_notification(msg)
+    metrics.incr("notifications")
     print(f"  行{row_index}: 更新検知 → LINE通知")
 
-    if col_prev_hash:
-        sheet.update_cell(row_index, col_prev_hash, current_hash)
-    if col_prev_len:
-        sheet.update_cell(row_index, col_prev_len, str(current_len))
+    save_row_state(sheet, row_index, row, col_map,
+                   prev_hash=current_hash, prev_len=str(current_len), **state)
+
+
+def fetch_feed(feed_url, etag="", modified=""):
+    """条件付きGET。304なら None、それ以外はレスポンスを返す（HTTPエラーは例外）"""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+    metrics.incr("http_requests")
+    resp = get_http_session().get(feed_url, timeout=15, headers=headers)
+    if resp.status_code == 304:
+        metrics.incr("not_modified")
+        return None
+    resp.raise_for_status()
+    metrics.incr("bytes_downloaded", len(resp.content))
+    return resp
+
+
+def find_feed(row_index, page_url, html):
+    """取得ステージ: ページからリンクされたフィード、無ければ（トップページなら）サイトマップを取得する
+
+    戻り値: 取得できたフィードの job (discovered=True)。候補が無いかサイトマップが取れなければ None。
+    リンクされたフィードの取得に失敗した時は error 付きの job（フィード無しとは扱わない）。
+    """
+    from feeds import discover_feed_links, sitemap_candidate
+    links = discover_feed_links(html, page_url)
+    feed_url = links[0] if links else sitemap_candidate(page_url)
+    if not feed_url:
+        return None
+    job = {"kind": "feed", "url": page_url, "feed_url": feed_url, "discovered": True}
+    try:
+        with metrics.stage(row_index, "fetch"):
+            resp = fetch_feed(feed_url)
+    except Exception as e:
+        metrics.incr("http_errors")
+        if not links:
+            return None
+        job["error"] = e
+        return job
+    if resp is None:
+        return None
+    job["content"] = resp.content
+    job["validators"] = {"feed_etag": resp.headers.get("ETag", ""),
+                         "feed_modified": resp.headers.get("Last-Modified", "")}
+    return job
 
 
-def generate_search_url(sheet, row_index, row, gemini_model, col_map):
+def apply_feed_result(sheet, row_index, row, col_map, job, result):
+    """フィード/サイトマップの比較結果を反映する。エントリのIDと更新日時が変わったらLINE通知"""
+    url = job["url"]
+    if "error" in job:
+        status = getattr(getattr(job["error"], "response", None), "status_code", None)
+        if status in (404, 410):
+            # フィードが無くなったら次回HTMLから探し直す
+            save_row_state(sheet, row_index, row, col_map, feed_url="", feed_etag="", feed_modified="")
+        print(f"  行{row_index}: フィード取得失敗 ({job['error']})")
+        return
+    if job.get("not_modified"):
+        print(f"  行{row_index}: 変更なし(304)")
+        return
+
+    discovered = job.get("discovered", False)
+    current_hash = result["hash"]
+    if current_hash is None:
+        # 解析できないフィードは使わず、次回からHTML比較に戻す
+        print(f"  行{row_index}: フィード解析失敗、HTML比較に戻します")
+        if discovered:
+            # 探索で見つけた候補（サイトマップ等）が使えなかっただけなら、HTMLの比較状態は残す
+            save_row_state(sheet, row_index, row, col_map, feed_url=NO_FEED)
+        else:
+            save_row_state(sheet, row_index, row, col_map, feed_url=NO_FEED, feed_etag="", feed_modified="",
+                           prev_hash="", prev_len="")
+        return
+
+    state = {"prev_hash": current_hash, "prev_len": str(result["length"])}
+    # 検証子は変わった時だけ書き込む
+    state.update({k: v for k, v in job["validators"].items() if v != str(row.get(k, '')).strip()})
+
+    # 初めて見つけたフィードは、HTMLのハッシュとは比べずに初回チェックとして保存する
+    prev_hash = "" if discovered else str(row.get('prev_hash', '')).strip()
+    if discovered:
+        print(f"  行{row_index}: フィード検出 → {job['feed_url']}")
+        state["feed_url"] = job["feed_url"]
+    if not prev_hash:
+        save_row_state(sheet, row_index, row, col_map, **state)
+        print(f"  行{row_index}: フィード初回チェック、{result['length']}件保存")
+        return
+
+    if current_hash == prev_hash:
+        state = {k: v for k, v in state.items() if k.startswith("feed_")}
+        if state:
+            save_row_state(sheet, row_index, row, col_map, **state)
+        print(f"  行{row_index}: 変更なし")
+        return
+
+    # --- 通知 --- 最新エントリのタイトルを添える
+    latest = result["latest"] or ("", "", "")
+    msg = f"🔔 サイト更新検知\n{url}"
+    if latest[2]:
+        msg += f"\n最新: {latest[2]}"
+    link = latest[0] if latest[0].startswith('http') else url
+    msg += f"\n{link}"
+    with metrics.stage(row_index, "notify"):
+        send_line_notification(msg)
+    metrics.incr("notifications")
+    print(f"  行{row_index}: フィード更新検知 → LINE通知")
+
+    save_row_state(sheet, row_index, row, col_map, **state)
+
+
+def check_site_update(sheet, row_index, row, col_map):
+    """1行分の更新チェック（取得 → 解析 → 書き込みをこのスレッドで順に実行）"""
+    try:
+        job = fetch_row(row_index, row, col_map)
+        result = analyze_page(*_analyze_job(job)) if "content" in job else None
+        apply_row(sheet, row_index, row, col_map, job, result)
+    except Exception as e:
+        # 1行の失敗で残りの行のチェックを止めない
+        print(f"  行{row_index}: 処理エラー ({e})")
+
+
+def get_parse_pool():
+    """解析用のプロセスプール（常駐モードでは実行をまたいで再利用）
+
+    取得スレッドが動いている中で fork しないよう spawn で起動する。
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        _parse_pool = ProcessPoolExecutor(max(1, PARSE_PROCESSES),
+                                          mp_context=multiprocessing.get_context("spawn"))
+    return _parse_pool
+
+
+def _discard_parse_pool(pool):
+    """壊れたプール（ワーカーがメモリ不足で強制終了された等）を捨て、次の get_parse_pool() で作り直す"""
+    global _parse_pool
+    if _parse_pool is pool:
+        _parse_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit_parse(job):
+    """解析プロセスに投げる。戻り値: (future, 使ったプール)。内容の無い行は (None, None)"""
+    from concurrent.futures.process import BrokenProcessPool
+    if "content" not in job:
+        return None, None
+    pool = get_parse_pool()
+    try:
+        return pool.submit(analyze_page, *_analyze_job(job)), pool
+    except BrokenProcessPool:
+        _discard_parse_pool(pool)
+        pool = get_parse_pool()
+        return pool.submit(analyze_page, *_analyze_job(job)), pool
+
+
+def _parse_result(job, future, pool):
+    """解析結果を受け取る。プールが壊れていたら作り直し、この行はこのプロセスで解析する"""
+    from concurrent.futures.process import BrokenProcessPool
+    if future is None:
+        return None
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        if _parse_pool is pool:
+            print("  解析プロセスが異常終了したため作り直します")
+            _discard_parse_pool(pool)
+        return analyze_page(*_analyze_job(job))
+
+
+def _fetch_worker(todo, fetched, col_map):
+    """取得スレッド: todo の行を順に取得して fetched に積む（満杯なら待つ）"""
+    while True:
+        try:
+            row_index, row = todo.get_nowait()
+        except queue.Empty:
+            break
+        try:
+            job = fetch_row(row_index, row, col_map)
+        except Exception as e:
+            job = {"kind": "html", "url": str(row.get('url', '')).strip(), "error": e}
+        fetched.put((row_index, row, job))
+    fetched.put(None)
+
+
+def check_rows(sheet, col_map, rows):
+    """期限の来た行 [(行番号, row), ...] をまとめて更新チェックする
+
+    PIPELINE_MIN_ROWS 行以上なら 取得(スレッド) → 解析(プロセスプール) → 書き込み(メインスレッド)
+    のパイプラインで処理する。段の間のキューと解析中の件数は PIPELINE_QUEUE_SIZE で頭打ちにし、
+    書き込みが詰まれば取得も止まるので、行数が多くてもメモリ使用量は増えない。
+    """
+    if len(rows) < PIPELINE_MIN_ROWS:
+        for row_index, row in rows:
+            check_site_update(sheet, row_index, row, col_map)
+        return
+
+    todo = queue.Queue()
+    for item in rows:
+        todo.put(item)
+    fetched = queue.Queue(PIPELINE_QUEUE_SIZE)
+    workers = [threading.Thread(target=_fetch_worker, args=(todo, fetched, col_map), daemon=True)
+               for _ in range(max(1, min(FETCH_WORKERS, len(rows))))]
+    for t in workers:
+        t.start()
+
+    inflight = deque()  # (行番号, row, job, future, pool) を取得順に
+    running = len(workers)
+    try:
+        while running or inflight:
+            # 先頭から解析の終わった行を書き込む。上限に達していれば先頭の完了を待つ
+            while inflight and (len(inflight) >= PIPELINE_QUEUE_SIZE or not running
+                                or inflight[0][3] is None or inflight[0][3].done()):
+                row_index, row, job, future, pool = inflight.popleft()
+                try:
+                    apply_row(sheet, row_index, row, col_map, job, _parse_result(job, future, pool))
+                except Exception as e:
+                    # 1行の失敗で取得済み・解析中の行を捨てない
+                    print(f"  行{row_index}: 処理エラー ({e})")
+            if not running:
+                continue
+            try:
+                item = fetched.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if item is None:
+                running -= 1
+                continue
+            row_index, row, job = item
+            inflight.append((row_index, row, job) + _submit_parse(job))
+    finally:
+        # 想定外の例外（Ctrl+C 等）で抜けたら残りの取得をやめさせ、キュー待ちのスレッドを解放する
+        while True:
+            try:
+                todo.get_nowait()
+            except queue.Empty:
+                break
+        while running:
+            if fetched.get() is None:
+                running -= 1
+        for *_, future, _pool in inflight:
+            if future:
+                future.cancel()
+
+
+def generate_search_url(sheet, row_index, row, col_map):
     """キーワード検索URL生成してシートに書き込み（Gemini優先）"""
     url_cell = str(row.get('url', '')).strip()
     word = str(row.get('word', '')).strip()
@@ -204,10 +802,12 @@ def generate_search_url(sheet, row_index, row, gemini_model, col_map):
     if memo_lower in DIRECT_TEMPLATES:
         new_url = DIRECT_TEMPLATES[memo_lower].format(word=quote(word))
         sheet.update_cell(row_index, col_url, new_url)
+        row['url'] = new_url
         print(f"  行{row_index}: テンプレートURL → {new_url}")
         return
 
     # 2. Geminiで「そのサイトの検索窓で検索したURL」を生成
+    gemini_model = get_gemini_model()
     if gemini_model:
         try:
             prompt = (
@@ -216,11 +816,14 @@ def generate_search_url(sheet, row_index, row, gemini_model, col_map):
                 f"そのサイトの検索機能を使った実際のURLを出力してください。\n"
                 f"URLのみを出力し、説明は不要です。"
             )
-            res = gemini_model.generate_content(prompt)
+            metrics.incr("llm_calls")
+            with metrics.stage(row_index, "llm"):
+                res = gemini_model.generate_content(prompt)
             new_url = res.text.strip()
             # URLとして妥当か簡易チェック
             if new_url.startswith('http') and ' ' not in new_url and len(new_url) < 500:
                 sheet.update_cell(row_index, col_url, new_url)
+                row['url'] = new_url
                 print(f"  行{row_index}: Gemini URL生成 → {new_url}")
                 return
             else:
@@ -246,92 +849,260 @@ def generate_search_url(sheet, row_index, row, gemini_model, col_map):
     # 既にGoogle検索URLが入っていれば上書きしない（次回Geminiリトライ用）
     if not url_cell.startswith('http'):
         sheet.update_cell(row_index, col_url, fallback)
+        row['url'] = fallback
         print(f"  行{row_index}: 仮URL(Google) → {fallback}")
     else:
         print(f"  行{row_index}: Gemini失敗、既存仮URLを維持")
 
 
-def should_run_now(row, current_hour):
-    """頻度設定に基づいて今実行すべきかを判定"""
+# 頻度列の書式（webapp.py の入力検証・表示も parse_interval を使う）
+# 数値だけなら時間単位（従来どおり）、"15m" / "15min" / "15分" は分、"2h" / "2時間" は時間
+FREQ_RE = re.compile(r'(\d+)\s*(m|min|分|h|時間)?')
+
+
+def parse_interval(value):
+    """頻度の値をチェック間隔(分)に変換。不正値や0以下は None"""
+    m = FREQ_RE.fullmatch(str(value).strip().lower())
+    if not m or int(m.group(1)) <= 0:
+        return None
+    n = int(m.group(1))
+    return n if m.group(2) in ('m', 'min', '分') else n * 60
+
+
+def get_interval_minutes(row):
+    """頻度列(count/freq)をチェック間隔(分)に変換。不正値は1時間"""
     freq_key = 'count' if 'count' in row else 'freq'
-    try:
-        freq = int(row.get(freq_key, 1))
-    except (ValueError, TypeError):
-        freq = 1
-    if freq <= 0:
-        freq = 1
+    return parse_interval(row.get(freq_key, 1)) or 60
+
+
+def should_run_now(row, current_hour):
+    """頻度設定に基づいて今実行すべきかを判定（毎時cron用。1時間未満の間隔は毎回実行）"""
+    freq = max(1, get_interval_minutes(row) // 60)
     return (current_hour % freq) == 0
 
 
-def main():
+def open_sheet():
+    """認証して監視設定シート(sheet1)を開く"""
+    import gspread
+    creds = get_credentials()
+    client = gspread.authorize(creds)
+    return client.open_by_key(SHEET_KEY).sheet1
+
+
+def ensure_state_columns(sheet):
+    """ヘッダーを読んで列マップを作る。状態列(prev_hash等)がなければ自動追加"""
+    headers = sheet.row_values(1)
+    col_map = {h: i + 1 for i, h in enumerate(headers)}
+    print(f"ヘッダー: {headers}")
+    for name in STATE_COLUMNS:
+        if name not in col_map:
+            idx = len(headers) + 1
+            sheet.update_cell(1, idx, name)
+            col_map[name] = idx
+            headers.append(name)
+            print(f"ヘッダーに {name} を追加")
+    return col_map
+
+
+def get_gemini_model():
+    """Geminiモデル（GEMINI_API_KEY があれば。プロセス内で1回だけ作る）"""
+    global _gemini_model
+    gemini_key = os.environ.get("GEMINI_API_KEY")
+    if _gemini_model is None and gemini_key:
+        import google.generativeai as genai
+        genai.configure(api_key=gemini_key)
+        _gemini_model = genai.GenerativeModel('gemini-2.5-flash')
+    return _gemini_model
+
+
+def needs_url_generation(row):
+    """URL未生成 or 仮URL（Google経由）の検索監視か"""
+    if str(row.get('memo', '')).strip() == "HP更新":
+        return False
+    url_cell = str(row.get('url', '')).strip()
+    return not url_cell.startswith('http') or 'google.com/search' in url_cell
+
+
+def process_row(sheet, row_index, row, col_map, due, generate=True):
+    """1行分の準備: 必要ならGeminiで検索URL生成。更新チェックすべき行なら True を返す"""
+    if needs_url_generation(row):
+        if generate:
+            generate_search_url(sheet, row_index, row, col_map)
+        if needs_url_generation(row):
+            return False  # 仮URLのままなら更新チェックもスキップ
+
+    # 頻度チェック（URL生成済みの監視・HP更新のみ）
+    if not due:
+        print(f"  行{row_index}: 頻度スキップ")
+        return False
+    return True
+
+
+def main(sheet=None):
+    """監視処理本体。sheet を渡すと認証を省略してそのシートを使う（ベンチマーク用）"""
+    global metrics
+    metrics = RunMetrics()
     print("--- 処理開始 ---")
 
     try:
-        creds = get_credentials()
-        client = gspread.authorize(creds)
-        sheet = client.open_by_key("1wSfyGreLH_lb7vR_vpmuJ3rAndtMNvMDQbv2ZlPVxUE").sheet1
+        if sheet is None:
+            sheet = open_sheet()
+        sheet = _MeteredSheet(sheet)
         print("認証成功")
 
-        # ヘッダー取得 & 列マップ作成
-        headers = sheet.row_values(1)
-        col_map = {h: i + 1 for i, h in enumerate(headers)}
-        print(f"ヘッダー: {headers}")
-
-        # prev_hash, prev_lenがなければ自動追加
-        if "prev_hash" not in col_map:
-            idx = len(headers) + 1
-            sheet.update_cell(1, idx, "prev_hash")
-            col_map["prev_hash"] = idx
-            headers.append("prev_hash")
-            print("ヘッダーに prev_hash を追加")
-        if "prev_len" not in col_map:
-            idx = len(headers) + 1
-            sheet.update_cell(1, idx, "prev_len")
-            col_map["prev_len"] = idx
-            headers.append("prev_len")
-            print("ヘッダーに prev_len を追加")
-
-        # Geminiモデル（キーがあれば）
-        gemini_key = os.environ.get("GEMINI_API_KEY")
-        gemini_model = None
-        if gemini_key:
-            genai.configure(api_key=gemini_key)
-            gemini_model = genai.GenerativeModel('gemini-2.5-flash')
+        col_map = ensure_state_columns(sheet)
 
         # 現在の時刻（UTC）
-        from datetime import datetime, timezone
         current_hour = datetime.now(timezone.utc).hour
 
         rows = sheet.get_all_records()
-        for i, row in enumerate(rows, start=2):
-            memo = str(row.get('memo', '')).strip()
-
-            # URL未生成 or 仮URL（Google経由）の検索監視 → Geminiで正式URL生成
-            if memo != "HP更新":
-                url_cell = str(row.get('url', '')).strip()
-                if not url_cell.startswith('http') or 'google.com/search' in url_cell:
-                    generate_search_url(sheet, i, row, gemini_model, col_map)
-                    if 'google.com/search' in str(row.get('url', '')):
-                        continue  # 仮URLのままなら更新チェックもスキップ
-                    if not str(row.get('url', '')).strip().startswith('http'):
-                        continue
-
-            # 頻度チェック（URL生成済みの監視・HP更新のみ）
-            if not should_run_now(row, current_hour):
-                print(f"  行{i}: 頻度スキップ")
-                continue
-
-            if memo == "HP更新":
-                check_site_update(sheet, i, row, col_map)
-            else:
-                # URL生成済みなら更新チェック
-                check_site_update(sheet, i, row, col_map)
+        targets = [(i, row) for i, row in enumerate(rows, start=2)
+                   if process_row(sheet, i, row, col_map, should_run_now(row, current_hour))]
+        check_rows(sheet, col_map, targets)
 
         print("--- 全処理完了 ---")
 
     except Exception as e:
         print(f"致命的なエラー: {e}")
 
+    print_run_summary()
+    metrics.flush()
+
+
+def print_run_summary():
+    s = metrics.summary()
+    c = s["counters"]
+    print(f"計測: {s['rows']}行 {s['wall_ms'] / 1000:.1f}s 取得{c['http_requests']}件 "
+          f"({c['bytes_downloaded'] // 1024}KB) Sheets API {c['sheets_api_calls']}回 通知{c['notifications']}件")
+
+
+# ============================================================
+# 常駐モード
+# ============================================================
+def _column_letter(col):
+    letters = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+class Watchlist:
+    """常駐モードでメモリに保持する監視行（行番号 → row dict）
+
+    状態列(prev_hash等)は書き込み時に save_row_state がメモリにも反映するので、
+    poll() では設定列(word/url/memo/頻度)だけを読み、変わった行だけを反映する。
+    """
+
+    def __init__(self, sheet, col_map):
+        self.sheet = sheet
+        self.col_map = col_map
+        self.config_cols = [(name, col_map[name]) for name in CONFIG_COLUMNS if name in col_map]
+        last_col = max((c for _, c in self.config_cols), default=1)
+        self.config_range = f"A2:{_column_letter(last_col)}"
+        self.rows = {}
+        self.config = {}
+
+    def _config_of_row(self, row):
+        return tuple(str(row.get(name, '')).strip() for name, _ in self.config_cols)
+
+    def _config_of_values(self, values):
+        return tuple(str(values[c - 1]).strip() if len(values) >= c else '' for _, c in self.config_cols)
+
+    def reload(self):
+        """全行を読み直す。戻り値: 前回に無かった設定の行番号"""
+        old = set(self.config.values())
+        self.rows = dict(enumerate(self.sheet.get_all_records(), start=2))
+        self.config = {i: self._config_of_row(row) for i, row in self.rows.items()}
+        return [i for i, cfg in self.config.items() if cfg not in old]
+
+    def poll(self):
+        """設定列だけを読み、変化を反映する。戻り値: 追加・変更された行番号
+
+        1行だけの編集はその行だけ、行の追加・削除や複数行の変更は全行を読み直す。
+        """
+        values = self.sheet.get(self.config_range)
+        config = {i: self._config_of_values(v) for i, v in enumerate(values, start=2)}
+        changed = [i for i in config if self.config.get(i) != config[i]]
+        if len(config) != len(self.config) or len(changed) > 1:
+            return self.reload()
+        # 変わった行は状態列(webapp.py がURL変更時に消す)も含めて1行だけ読み直す
+        for i in changed:
+            values = self.sheet.row_values(i)
+            self.rows[i] = {name: values[c - 1] if len(values) >= c else ''
+                            for name, c in self.col_map.items()}
+            self.config[i] = config[i]
+        return changed
+
+
+class Daemon:
+    """1分刻みで期限が来た行だけをチェックする常駐ループ
+
+    認証済みシート・HTTP接続プール・Geminiモデル・行の状態はプロセス内で使い回す。
+    各行は「エポックからの分 ÷ チェック間隔」の値が変わった分で実行するので、
+    処理が長引いて分を飛ばしても取りこぼさない。
+    """
+
+    def __init__(self, sheet):
+        self.sheet = _MeteredSheet(sheet)
+        self.col_map = ensure_state_columns(self.sheet)
+        self.watchlist = Watchlist(self.sheet, self.col_map)
+        self.pending = set(self.watchlist.reload())
+        self.last_poll = time.time()
+        self.last_minute = None
+
+    def tick(self, now):
+        global metrics
+        metrics = RunMetrics()
+        minute = int(now // 60)
+        last = self.last_minute if self.last_minute is not None else minute - 1
+        self.last_minute = minute
+
+        if now - self.last_poll >= CONFIG_POLL_SECONDS:
+            self.last_poll = now
+            try:
+                self.pending.update(self.watchlist.poll())
+            except Exception as e:
+                print(f"設定の再読込失敗: {e}")
+
+        # 仮URLのGemini再生成は毎時1回（cron運用と同じ頻度）、新規・変更行はすぐ
+        new_hour = minute // 60 > last // 60
+        processed = False
+        targets = []
+        for i, row in sorted(self.watchlist.rows.items()):
+            interval = get_interval_minutes(row)
+            due = minute // interval > last // interval
+            generate = new_hour or i in self.pending
+            if due or (generate and needs_url_generation(row)):
+                processed = True
+                if process_row(self.sheet, i, row, self.col_map, due, generate):
+                    targets.append((i, row))
+        self.pending.clear()
+        check_rows(self.sheet, self.col_map, targets)
+
+        if processed:
+            print_run_summary()
+            metrics.flush()
+
+
+def run_daemon(sheet=None):
+    """常駐モード: 毎分0秒に期限の来た行をチェックし続ける"""
+    print("--- 常駐モード開始 ---")
+    daemon = Daemon(sheet if sheet is not None else open_sheet())
+    print(f"認証成功、監視 {len(daemon.watchlist.rows)}件")
+    try:
+        while True:
+            try:
+                daemon.tick(time.time())
+            except Exception as e:
+                print(f"エラー: {e}")
+            time.sleep(60 - time.time() % 60)
+    except KeyboardInterrupt:
+        print("--- 常駐モード終了 ---")
+
 
 if __name__ == "__main__":
-    main()
+    if "--daemon" in sys.argv[1:]:
+        run_daemon()
+    else:
+        main()
@@ -0,0 +1,114 @@
+"""保存済みスナップショットで変更検知を再評価する（ネットワーク不要）
+
+monitor.py を SNAPSHOT_DIR 付きで動かして溜めた履歴に対して、
+MIN_CHANGE_CHARS / MIN_CHANGE_RATIO / SMALL_PAGE_THRESHOLD の組み合わせごとに
+何件のLINE通知が出ていたかを数える。組み合わせはCPUコア数ぶん並列に評価する。
+
+使い方:
+    python replay.py snapshots/ --min-chars 20,50,100 --min-ratio 0.01,0.05,0.1 --small-page 2000,5000
+    python replay.py snapshots/ --since 2026-01-01 --json
+"""
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import monitor
+from snapshots import SnapshotStore
+
+_HISTORIES = None
+
+
+def _init_worker(histories):
+    global _HISTORIES
+    _HISTORIES = histories
+
+
+def count_alerts(histories, min_chars, min_ratio, small_page):
+    """URL → [len, ...] の履歴に対して monitor.apply_page_result と同じ判定を流し、通知数を数える
+
+    履歴はハッシュが変わった版だけなので、先頭（初回チェック）以外の各版が「ハッシュ変化」にあたる。
+    軽微変更でも通知でも prev_len は新しい版に更新される点も本番と同じ。
+    """
+    alerts = 0
+    per_url = {}
+    for url, lens in histories.items():
+        n = 0
+        for prev_len, current_len in zip(lens, lens[1:]):
+            minor, _, _ = monitor.classify_change(prev_len, current_len, min_chars, min_ratio, small_page)
+            if not minor:
+                n += 1
+        if n:
+            per_url[url] = n
+        alerts += n
+    return alerts, per_url
+
+
+def _evaluate(params):
+    alerts, per_url = count_alerts(_HISTORIES, *params)
+    return params, alerts, per_url
+
+
+def _floats(text):
+    return [float(v) for v in text.split(",") if v]
+
+
+def _ints(text):
+    return [int(v) for v in text.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="スナップショット履歴で変更検知の閾値を評価する")
+    parser.add_argument("snapshot_dir", nargs="?", default=os.environ.get("SNAPSHOT_DIR", "snapshots"))
+    parser.add_argument("--min-chars", type=_ints, default=[monitor.MIN_CHANGE_CHARS])
+    parser.add_argument("--min-ratio", type=_floats, default=[monitor.MIN_CHANGE_RATIO])
+    parser.add_argument("--small-page", type=_ints, default=[monitor.SMALL_PAGE_THRESHOLD])
+    parser.add_argument("--since", help="この日付(YYYY-MM-DD, UTC)以降の履歴だけを使う")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--top", type=int, default=5, help="通知の多いURLを何件表示するか")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    since = None
+    if args.since:
+        since = datetime.strptime(args.since, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+    store = SnapshotStore(args.snapshot_dir)
+    histories = {url: [e[2] for e in versions] for url, versions in store.history(since).items()}
+    changes = sum(len(v) - 1 for v in histories.values())
+
+    grid = list(itertools.product(args.min_chars, args.min_ratio, args.small_page))
+    workers = max(1, min(args.workers or 1, len(grid)))
+    if workers == 1:
+        _init_worker(histories)
+        results = [_evaluate(p) for p in grid]
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(histories,)) as pool:
+            results = list(pool.map(_evaluate, grid, chunksize=max(1, len(grid) // (workers * 4))))
+
+    current = (monitor.MIN_CHANGE_CHARS, monitor.MIN_CHANGE_RATIO, monitor.SMALL_PAGE_THRESHOLD)
+    if args.json:
+        print(json.dumps({
+            "urls": len(histories),
+            "changes": changes,
+            "results": [
+                {"min_chars": p[0], "min_ratio": p[1], "small_page": p[2], "alerts": alerts,
+                 "top_urls": sorted(per_url.items(), key=lambda kv: -kv[1])[:args.top]}
+                for p, alerts, per_url in results
+            ],
+        }, ensure_ascii=False, indent=2))
+        return
+
+    print(f"URL {len(histories)}件 / ハッシュ変化 {changes}回")
+    print(f"{'min_chars':>9} {'min_ratio':>9} {'small_page':>10} {'alerts':>7}")
+    for p, alerts, per_url in sorted(results, key=lambda r: r[1]):
+        mark = "  ← 現在の設定" if p == current else ""
+        print(f"{p[0]:>9} {p[1]:>9} {p[2]:>10} {alerts:>7}{mark}")
+    if len(results) == 1 and args.top:
+        for url, n in sorted(results[0][2].items(), key=lambda kv: -kv[1])[:args.top]:
+            print(f"  {n:>4}回  {url}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""ページスナップショットの保存 — sha256で内容アドレス化、前の版との差分で圧縮
+
+ディレクトリ構成:
+    <root>/objects/ab/abcdef....zst  版の本体（zstd圧縮。zstandard未導入なら .z = zlib）
+    <root>/index.jsonl               URLごとの版の履歴 {"ts", "url", "hash", "len"}
+
+オブジェクトは「全文(キーフレーム)」か「同じURLの前の版に対する行単位の差分」のどちらか。
+差分が KEYFRAME_INTERVAL 個続いたら次は全文で保存し、復元時にたどる差分の数を抑える。
+同じ内容を何度取得してもオブジェクトは1つだけ、履歴もハッシュが変わった時だけ追記するので、
+容量は取得回数ではなく実際の変更回数（と変更量）に比例する。
+"""
+import difflib
+import gzip
+import hashlib
+import json
+import os
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+KEYFRAME_INTERVAL = 20
+
+
+def content_hash(text):
+    """monitor.py の prev_hash と同じsha256"""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def make_delta(old_lines, new_lines):
+    """old → new の行単位差分。["c", i1, i2] は旧版の行範囲コピー、["i", [行...]] は挿入"""
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["c", i1, i2])
+        elif j2 > j1:
+            ops.append(["i", new_lines[j1:j2]])
+    return ops
+
+
+def apply_delta(old_lines, ops):
+    lines = []
+    for op in ops:
+        if op[0] == "c":
+            lines.extend(old_lines[op[1]:op[2]])
+        else:
+            lines.extend(op[1])
+    return lines
+
+
+def summarize_diff(old_text, new_text, max_lines=5, max_chars=400):
+    """LINE通知用の差分要約（追加行の先頭数行と、追加/削除行数）"""
+    old_lines = old_text.split("\n")
+    new_lines = new_text.split("\n")
+    added, removed = [], 0
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag in ("replace", "delete"):
+            removed += i2 - i1
+        if tag in ("replace", "insert"):
+            added.extend(new_lines[j1:j2])
+    if not added and not removed:
+        return ""
+    lines = [f"差分: +{len(added)}行 / -{removed}行"]
+    body = ""
+    for line in added[:max_lines]:
+        line = "+ " + line.strip()
+        if len(body) + len(line) > max_chars:
+            break
+        body += line + "\n"
+    if body:
+        lines.append(body.rstrip("\n"))
+    if len(added) > max_lines:
+        lines.append("…")
+    return "\n".join(lines)
+
+
+def _compress(data):
+    if zstandard:
+        return zstandard.ZstdCompressor(level=10).compress(data), ".zst"
+    return zlib.compress(data, 9), ".z"
+
+
+class SnapshotStore:
+    def __init__(self, root, keyframe_interval=KEYFRAME_INTERVAL):
+        self.root = root
+        self.keyframe_interval = keyframe_interval
+        self.index_path = os.path.join(root, "index.jsonl")
+        self._last = None
+
+    def _object_path(self, h, ext):
+        return os.path.join(self.root, "objects", h[:2], h + ext)
+
+    def _find(self, h):
+        """オブジェクトのパスを探す（zstd / zlib / 旧形式のgzip全文）"""
+        for ext in (".zst", ".z", ".gz"):
+            path = self._object_path(h, ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _read(self, h):
+        """オブジェクトを {"text": ...} か {"base", "depth", "ops"} として読む"""
+        path = self._find(h)
+        if path is None:
+            return None
+        if path.endswith(".gz"):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return {"text": f.read()}
+        with open(path, "rb") as f:
+            raw = f.read()
+        if path.endswith(".zst"):
+            if zstandard is None:
+                raise RuntimeError("zstandard が未インストールのため .zst スナップショットを読めません")
+            raw = zstandard.ZstdDecompressor().decompress(raw)
+        else:
+            raw = zlib.decompress(raw)
+        return json.loads(raw.decode("utf-8"))
+
+    def _write(self, h, obj):
+        data, ext = _compress(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        path = self._object_path(h, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _load_last(self):
+        """URL → 最新ハッシュ の対応を index から作る（初回のみ）"""
+        if self._last is None:
+            # 取得スレッドからも呼ばれるので、作り終えてから差し替える
+            last = {}
+            for entry in self.iter_index():
+                last[entry["url"]] = entry["hash"]
+            self._last = last
+        return self._last
+
+    def iter_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    def last_hash(self, url):
+        return self._load_last().get(url)
+
+    def has(self, h):
+        return self._find(h) is not None
+
+    def put(self, url, text, h=None, ts=None):
+        """本文を保存して履歴に追記する。前回と同じ内容なら何もしない。ハッシュを返す"""
+        h = h or content_hash(text)
+        base = self.last_hash(url)
+        if base == h:
+            return h
+        if not self.has(h):
+            self._write(h, self._encode(text, base))
+        entry = {"ts": round(ts or time.time(), 3), "url": url, "hash": h, "len": len(text)}
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._last[url] = h
+        return h
+
+    def _encode(self, text, base):
+        """前の版があれば差分、無いかキーフレーム間隔に達したら全文"""
+        if base:
+            base_obj = self._read(base)
+            depth = base_obj.get("depth", 0) + 1 if base_obj else self.keyframe_interval
+            if depth < self.keyframe_interval:
+                base_text = self.get(base)
+                ops = make_delta(base_text.split("\n"), text.split("\n"))
+                # 差分の方が大きくなるほど書き換わったなら全文で持つ
+                if len(json.dumps(ops, ensure_ascii=False)) < len(text):
+                    return {"base": base, "depth": depth, "ops": ops}
+        return {"text": text}
+
+    def get(self, h):
+        """ハッシュから本文を復元する（無ければ None）"""
+        chain = []
+        obj = self._read(h)
+        while obj is not None and "text" not in obj:
+            chain.append(obj["ops"])
+            obj = self._read(obj["base"])
+        if obj is None:
+            return None
+        lines = obj["text"].split("\n")
+        for ops in reversed(chain):
+            lines = apply_delta(lines, ops)
+        return "\n".join(lines)
+
+    def history(self, since=None):
+        """URL → [(ts, hash, len), ...]（時系列順）"""
+        result = {}
+        for entry in self.iter_index():
+            if since and entry["ts"] < since:
+                continue
+            result.setdefault(entry["url"], []).append((entry["ts"], entry["hash"], entry["len"]))
+        return result
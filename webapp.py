@@ -1,13 +1,20 @@
 """Web更新チェッカー — Flask版"""
 import os
+import io
+import csv
 import json
 import base64
 import re
+import time
+import threading
 import gspread
+from gspread.utils import rowcol_to_a1
 from google.oauth2.service_account import Credentials
-from flask import Flask, render_template, request, redirect, url_for, Response
+from flask import Flask, render_template, request, redirect, url_for, Response, jsonify
 from urllib.parse import quote
 
+from monitor import parse_interval
+
 app = Flask(__name__)
 
 SHEET_KEY = "1wSfyGreLH_lb7vR_vpmuJ3rAndtMNvMDQbv2ZlPVxUE"
@@ -16,6 +23,9 @@ SCOPES = [
     "https://www.googleapis.com/auth/drive",
 ]
 
+# monitor.py が管理する比較状態の列
+STATE_COLUMNS = ("prev_hash", "prev_len", "feed_url", "feed_etag", "feed_modified")
+
 # GCP鍵ファイルのパス (PythonAnywhere用)
 KEY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gcp_key.json")
 
@@ -143,6 +153,26 @@ def generate_url_now(word, memo):
     return f"https://www.google.com/search?q={quote(word)}+{quote(memo)}"
 
 
+# --- チェック間隔 ---
+# 書式は monitor.py の parse_interval と共通: 数値は時間単位、"15m" / "15min" / "15分" は分、"2h" / "2時間" は時間
+# （1時間未満の間隔は monitor.py の常駐モード(--daemon)でのみ有効）
+def parse_freq(value, default=12):
+    """フォームの頻度入力をシートに書く値に変換（数値だけなら int、単位付きはそのまま）。0以下や不正値は default"""
+    value = str(value or "").strip()
+    if parse_interval(value) is None:
+        return default
+    return int(value) if value.isdigit() else value
+
+
+@app.template_filter("freq_label")
+def freq_label(value):
+    """頻度の表示用ラベル（"6" → 6時間ごと、"15分" → 15分ごと）。不正値は monitor.py と同じく1時間"""
+    minutes = parse_interval(value) or 60
+    if minutes % 60 == 0:
+        return f"{minutes // 60}時間ごと"
+    return f"{minutes}分ごと"
+
+
 # --- favicon / apple-touch-icon (空SVGで404を回避) ---
 _FAVICON_SVG = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100"><text y="80" font-size="80">📡</text></svg>'
 
@@ -156,31 +186,163 @@ def apple_touch_icon():
     return Response(status=204)
 
 
+# --- 一覧の行キャッシュ ---
+# 一覧API (/api/rows) はスクロールのたびに呼ばれるので、シート全体は ROWS_TTL 秒に1回だけ読み、
+# ページ分割・絞り込みはメモリ上の行で行う。追加・編集・削除・インポートでは即座に捨てる
+# （gunicornの別ワーカーのキャッシュは TTL で入れ替わる）
+ROWS_TTL = int(os.environ.get("ROWS_TTL", 60))
+PAGE_SIZE = 50
+PAGE_SIZE_MAX = 200
+_rows_cache = {"rows": None, "loaded_at": 0.0}
+_rows_lock = threading.Lock()
+
+
+def load_rows():
+    """監視行 [(行番号, row), ...] を返す。キャッシュが古ければシートから読み直す"""
+    with _rows_lock:
+        if _rows_cache["rows"] is not None and time.time() - _rows_cache["loaded_at"] <= ROWS_TTL:
+            return _rows_cache["rows"]
+        sheet = get_sheet()
+        if not sheet:
+            raise RuntimeError("Google Sheetsに接続できません")
+        headers = sheet.row_values(1)
+        col = {h: i + 1 for i, h in enumerate(headers)}
+        rows = list(enumerate(sheet.get_all_records(), start=2))
+        # URL未生成の検索監視があれば自動生成
+        for i, row in rows:
+            memo = str(row.get('memo', '')).strip()
+            url = str(row.get('url', '')).strip()
+            word = str(row.get('word', '')).strip()
+            if memo != "HP更新" and not url.startswith('http') and word and memo:
+                generated = generate_url_now(word, memo)
+                if generated and 'url' in col:
+                    sheet.update_cell(i, col['url'], generated)
+                    row['url'] = generated
+        _rows_cache["rows"] = rows
+        _rows_cache["loaded_at"] = time.time()
+        return rows
+
+
+def invalidate_rows():
+    with _rows_lock:
+        _rows_cache["rows"] = None
+
+
+def current_watch_row(sheet, row_index, col, form):
+    """row_index の行がまだ画面で選んだ監視か確かめ、そうなら現在の行の値を返す（違えば None）
+
+    一覧はキャッシュ(最大 ROWS_TTL 秒前)から描画しているので、その間に app.py や別ワーカーが
+    行を削除していると行番号が別の監視を指す。フォームの key_word / key_url / key_memo と照合する。
+    """
+    values = sheet.row_values(row_index)
+
+    def cell(name):
+        c = col.get(name)
+        return str(values[c - 1]).strip() if c and len(values) >= c else ""
+
+    expected = _watch_key(form.get("key_word", "").strip(), form.get("key_url", "").strip(),
+                          form.get("key_memo", "").strip())
+    if _watch_key(cell("word"), cell("url"), cell("memo")) != expected:
+        return None
+    return values
+
+
+def row_status(is_url, url, prev_hash):
+    """カードに出すステータス (ok / wait, 表示文字列)"""
+    if is_url:
+        return ("ok", "✅ 監視中") if prev_hash.strip() else ("wait", "⏳ 初回待ち")
+    if url.strip() and 'google.com/search' not in url:
+        return "ok", "✅ URL生成済"
+    if url.strip():
+        return "wait", "🔄 Gemini生成待ち"
+    return "wait", "⏳ URL未生成"
+
+
+def row_view(i, row):
+    """一覧表示用の1行（テンプレートのJSが使う項目だけ）"""
+    word = str(row.get('word', ''))
+    url = str(row.get('url', ''))
+    memo = str(row.get('memo', ''))
+    freq = str(row.get('count', '') or row.get('freq', ''))
+    is_url = memo == "HP更新"
+    status, status_label = row_status(is_url, url, str(row.get('prev_hash', '')))
+    return {
+        "row": i, "type": "url" if is_url else "kw",
+        "word": word, "url": url, "memo": memo,
+        "freq": freq, "freq_label": freq_label(freq),
+        "status": status, "status_label": status_label,
+    }
+
+
+def filter_rows(rows, kind="", site="", q=""):
+    """種類(url/kw)・サイト名・検索語で絞り込む"""
+    site = site.strip().lower()
+    q = q.strip().lower()
+    for i, row in rows:
+        memo = str(row.get('memo', '')).strip()
+        is_url = memo == "HP更新"
+        if (kind == "url" and not is_url) or (kind == "kw" and is_url):
+            continue
+        if site and (is_url or memo.lower() != site):
+            continue
+        if q and not any(q in str(row.get(k, '')).lower() for k in ("word", "url", "memo")):
+            continue
+        yield i, row
+
+
+def rows_page(rows, kind="", site="", q="", offset=0, limit=PAGE_SIZE):
+    """絞り込んだ行の offset から limit 件と、該当件数・次のoffset"""
+    matched = list(filter_rows(rows, kind, site, q))
+    page = [row_view(i, row) for i, row in matched[offset:offset + limit]]
+    next_offset = offset + len(page)
+    return {
+        "total": len(matched),
+        "offset": offset,
+        "rows": page,
+        "next_offset": next_offset if next_offset < len(matched) else None,
+    }
+
+
+def _int_arg(name, default, lo, hi):
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        value = default
+    return max(lo, min(value, hi))
+
+
+@app.route("/api/rows")
+def api_rows():
+    """監視一覧をページ単位で返す
+
+    GET /api/rows?offset=0&limit=50&type=url|kw&site=食べログ&q=ラーメン
+    """
+    try:
+        rows = load_rows()
+    except Exception as e:
+        return jsonify(error=str(e)), 503
+    return jsonify(rows_page(
+        rows,
+        kind=request.args.get("type", ""),
+        site=request.args.get("site", ""),
+        q=request.args.get("q", ""),
+        offset=_int_arg("offset", 0, 0, len(rows)),
+        limit=_int_arg("limit", PAGE_SIZE, 1, PAGE_SIZE_MAX),
+    ))
+
+
 @app.route("/")
 def index():
-    sheet = get_sheet()
+    """最初の1ページだけを埋め込んで返す。続きはスクロール・検索時に /api/rows から読む"""
     rows = []
     error = None
-    if sheet:
-        try:
-            headers = sheet.row_values(1)
-            col = {h: i + 1 for i, h in enumerate(headers)}
-            rows = sheet.get_all_records()
-            # URL未生成の検索監視があれば自動生成
-            for i, row in enumerate(rows, start=2):
-                memo = str(row.get('memo', '')).strip()
-                url = str(row.get('url', '')).strip()
-                word = str(row.get('word', '')).strip()
-                if memo != "HP更新" and not url.startswith('http') and word and memo:
-                    generated = generate_url_now(word, memo)
-                    if generated and 'url' in col:
-                        sheet.update_cell(i, col['url'], generated)
-                        row['url'] = generated
-        except Exception as e:
-            error = str(e)
-    else:
-        error = "Google Sheetsに接続できません"
-    return render_template("index.html", rows=rows, error=error)
+    try:
+        rows = load_rows()
+    except Exception as e:
+        error = str(e)
+    sites = sorted({str(row.get('memo', '')).strip() for _, row in rows} - {"", "HP更新"})
+    return render_template("index.html", total=len(rows), first_page=rows_page(rows),
+                           sites=sites, error=error)
 
 
 @app.route("/add", methods=["POST"])
@@ -194,7 +356,7 @@ def add():
         url = request.form.get("url", "").strip()
         freq = request.form.get("freq", "12")
         if url:
-            sheet.append_row(["update", url, "HP更新", int(freq), "", ""])
+            sheet.append_row(["update", url, "HP更新", parse_freq(freq), "", ""])
     else:
         keyword = request.form.get("keyword", "").strip()
         source_type = request.form.get("source_type", "preset")
@@ -206,8 +368,9 @@ def add():
         if keyword and source:
             # 即座にURL生成を試みる
             generated_url = generate_url_now(keyword, source)
-            sheet.append_row([keyword, generated_url, source, int(freq), "", ""])
+            sheet.append_row([keyword, generated_url, source, parse_freq(freq), "", ""])
 
+    invalidate_rows()
     return redirect(url_for("index"))
 
 
@@ -219,7 +382,7 @@ def edit():
 
     row_index = int(request.form.get("row_index", 0))
     edit_mode = request.form.get("edit_mode", "")
-    freq = int(request.form.get("edit_freq", "12"))
+    freq = parse_freq(request.form.get("edit_freq", "12"))
 
     if row_index < 2:
         return redirect(url_for("index"))
@@ -228,49 +391,206 @@ def edit():
     headers = sheet.row_values(1)
     col = {h: i + 1 for i, h in enumerate(headers)}
 
+    try:
+        current_row = current_watch_row(sheet, row_index, col, request.form)
+    except Exception:
+        current_row = None
+    if current_row is None:
+        invalidate_rows()
+        return redirect(url_for("index"))
+
+    def current(name):
+        c = col.get(name)
+        return str(current_row[c - 1]).strip() if c and len(current_row) >= c else ""
+
+    # フォームは変更していない項目も今の値で送ってくるので、実際に変わったセルだけを1回で書く
+    cells = []
     try:
         if edit_mode == "url":
             new_url = request.form.get("edit_url", "").strip()
-            if new_url and 'url' in col:
-                sheet.update_cell(row_index, col['url'], new_url)
+            if new_url and 'url' in col and new_url != current('url'):
+                # URLが変わったら前のページの比較状態・検出済みフィードを捨てる（monitor.pyが初回チェックからやり直す）
+                cells.append((col['url'], new_url))
+                cells += [(col[name], "") for name in STATE_COLUMNS if name in col]
         else:
-            new_word = request.form.get("edit_word", "").strip()
-            new_memo = request.form.get("edit_memo", "").strip()
-            if new_word and 'word' in col:
-                sheet.update_cell(row_index, col['word'], new_word)
-            if new_memo and 'memo' in col:
-                sheet.update_cell(row_index, col['memo'], new_memo)
-            # キーワードかメモが変わったらURLを即時再生成
-            if (new_word or new_memo) and 'url' in col:
-                # 現在の値を取得（変更されていない方）
-                current_row = sheet.row_values(row_index)
-                word_val = new_word or (current_row[col['word'] - 1] if len(current_row) >= col['word'] else "")
-                memo_val = new_memo or (current_row[col['memo'] - 1] if len(current_row) >= col['memo'] else "")
-                if word_val and memo_val and memo_val != "HP更新":
-                    generated_url = generate_url_now(word_val, memo_val)
-                    sheet.update_cell(row_index, col['url'], generated_url)
+            word_val = request.form.get("edit_word", "").strip() or current('word')
+            memo_val = request.form.get("edit_memo", "").strip() or current('memo')
+            if 'word' in col and word_val != current('word'):
+                cells.append((col['word'], word_val))
+            if 'memo' in col and memo_val != current('memo'):
+                cells.append((col['memo'], memo_val))
+            # キーワードかサイトが変わったらURLを即時再生成。URLが変われば比較状態も捨てる
+            if cells and 'url' in col and word_val and memo_val and memo_val != "HP更新":
+                generated_url = generate_url_now(word_val, memo_val)
+                if generated_url != current('url'):
+                    cells.append((col['url'], generated_url))
+                    cells += [(col[name], "") for name in STATE_COLUMNS if name in col]
 
         # 頻度列（countまたはfreq）
         freq_col = col.get('count') or col.get('freq')
-        if freq_col:
-            sheet.update_cell(row_index, freq_col, freq)
+        if freq_col and str(freq) != current('count' if 'count' in col else 'freq'):
+            cells.append((freq_col, freq))
+        if cells:
+            sheet.batch_update([{"range": rowcol_to_a1(row_index, c), "values": [[v]]} for c, v in cells])
     except Exception:
         pass
 
+    invalidate_rows()
     return redirect(url_for("index"))
 
 
 @app.route("/delete/<int:row_index>", methods=["POST"])
 def delete(row_index):
     sheet = get_sheet()
-    if sheet:
+    if sheet and row_index >= 2:
         try:
-            sheet.delete_rows(row_index)
+            headers = sheet.row_values(1)
+            col = {h: i + 1 for i, h in enumerate(headers)}
+            if current_watch_row(sheet, row_index, col, request.form) is not None:
+                sheet.delete_rows(row_index)
         except Exception:
             pass
+    invalidate_rows()
     return redirect(url_for("index"))
 
 
+# --- 一括インポート / エクスポート ---
+# curl -F file=@watches.csv https://.../import
+# curl -H "Content-Type: application/json" -d '[{"word": "ラーメン", "memo": "食べログ"}]' https://.../import
+# curl https://.../export?format=csv > watches.csv
+BULK_MAX_ROWS = 5000
+EXPORT_COLUMNS = ("word", "url", "memo", "count", "freq")
+
+
+def _read_bulk_entries():
+    """リクエストから監視エントリ(dictのリスト)を読む。JSON / CSVファイル / CSV本文に対応"""
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get("watches")
+        if not isinstance(data, list):
+            raise ValueError("JSONは監視エントリの配列、または {\"watches\": [...]} で送ってください")
+        return data
+    upload = request.files.get("file")
+    if upload:
+        text = upload.read().decode("utf-8-sig")
+    else:
+        text = request.form.get("csv") or request.get_data(as_text=True)
+        text = text.lstrip("\ufeff")
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def _watch_key(word, url, memo):
+    """重複判定用のキー（URL監視はURL、検索監視はキーワード+サイト名）"""
+    if memo == "HP更新":
+        return ("url", url)
+    return ("kw", word, memo.lower())
+
+
+def _bulk_row(entry):
+    """エントリ1件を検証してシートの1行にする。不正なら ValueError"""
+    if not isinstance(entry, dict):
+        raise ValueError("オブジェクトではありません")
+    word = str(entry.get("word") or "").strip()
+    url = str(entry.get("url") or "").strip()
+    memo = str(entry.get("memo") or "").strip()
+    raw_freq = entry.get("freq")
+    if raw_freq is None or raw_freq == "":
+        raw_freq = entry.get("count")
+    raw_freq = "" if raw_freq is None else str(raw_freq).strip()
+    freq = parse_freq(raw_freq, default=None) if raw_freq else 12
+    if freq is None:
+        raise ValueError("freq は正の時間数か \"15m\" のような分数で指定してください")
+
+    if memo == "HP更新" or (url and not word):
+        if not url.startswith("http"):
+            raise ValueError("URL監視には http(s) のURLが必要です")
+        return ["update", url, "HP更新", freq, "", ""]
+    if not word or not memo:
+        raise ValueError("検索監視には word と memo(サイト名) が必要です")
+    if not url.startswith("http"):
+        url = generate_url_now(word, memo)
+    return [word, url, memo, freq, "", ""]
+
+
+@app.route("/import", methods=["POST"])
+def bulk_import():
+    """監視を一括追加する。既存行・同じ送信内の重複は飛ばし、まとめて1回の append_rows で書く"""
+    sheet = get_sheet()
+    if not sheet:
+        return jsonify(error="Google Sheetsに接続できません"), 503
+    try:
+        entries = _read_bulk_entries()
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify(error=str(e)), 400
+    if len(entries) > BULK_MAX_ROWS:
+        return jsonify(error=f"一度に追加できるのは{BULK_MAX_ROWS}件までです"), 413
+
+    seen = set()
+    for row in sheet.get_all_records():
+        seen.add(_watch_key(str(row.get("word", "")).strip(), str(row.get("url", "")).strip(),
+                            str(row.get("memo", "")).strip()))
+
+    new_rows, errors, duplicates = [], [], 0
+    for n, entry in enumerate(entries, start=1):
+        try:
+            values = _bulk_row(entry)
+        except ValueError as e:
+            errors.append({"index": n, "error": str(e)})
+            continue
+        key = _watch_key(values[0], values[1], values[2])
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+        new_rows.append(values)
+
+    if new_rows:
+        sheet.append_rows(new_rows)
+        invalidate_rows()
+    status = 400 if errors and not new_rows and not duplicates else 200
+    return jsonify(added=len(new_rows), duplicates=duplicates, errors=errors), status
+
+
+@app.route("/export")
+def bulk_export():
+    """現在の監視設定を CSV(既定) / JSON で返す。行ごとに生成してストリーミングする"""
+    sheet = get_sheet()
+    if not sheet:
+        return jsonify(error="Google Sheetsに接続できません"), 503
+    values = sheet.get_all_values()
+    headers = values[0] if values else []
+    cols = [(name, headers.index(name)) for name in EXPORT_COLUMNS if name in headers]
+
+    def records():
+        for r in values[1:]:
+            rec = {name: (r[i] if i < len(r) else "") for name, i in cols}
+            if any(rec.values()):
+                yield rec
+
+    if request.args.get("format") == "json":
+        def generate_json():
+            yield "["
+            for n, rec in enumerate(records()):
+                yield ("," if n else "") + json.dumps(rec, ensure_ascii=False)
+            yield "]"
+        return Response(generate_json(), mimetype="application/json")
+
+    def generate_csv():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        # Excelで文字化けしないようBOM付き
+        writer.writerow(name for name, _ in cols)
+        yield "\ufeff" + buf.getvalue()
+        for rec in records():
+            buf.seek(0)
+            buf.truncate()
+            writer.writerow(rec.values())
+            yield buf.getvalue()
+    return Response(generate_csv(), mimetype="text/csv",
+                    headers={"Content-Disposition": "attachment; filename=watches.csv"})
+
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port, debug=False)